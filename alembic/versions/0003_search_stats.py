@@ -0,0 +1,52 @@
+"""search_stats table
+
+Revision ID: 0003_search_stats
+Revises: 0002_product_search
+Create Date: 2026-10-17 00:00:00
+
+"""
+import json
+import os
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003_search_stats'
+down_revision = '0002_product_search'
+branch_labels = None
+depends_on = None
+
+# Legacy per-product search counts written by the catalog before this table existed
+LEGACY_SEARCH_STATS_FILE = os.path.join("analytics", "search_stats.json")
+
+
+def upgrade() -> None:
+    search_stats = op.create_table('search_stats',
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('search_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=False)
+    )
+
+    if not os.path.exists(LEGACY_SEARCH_STATS_FILE):
+        return
+    try:
+        with open(LEGACY_SEARCH_STATS_FILE, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+    except (OSError, ValueError):
+        return
+
+    bind = op.get_bind()
+    existing = {row[0] for row in bind.execute(sa.text("SELECT id FROM products"))}
+    now = datetime.now()
+    rows = [
+        {"product_id": int(pid), "search_count": int(count), "updated_at": now}
+        for pid, count in legacy.items()
+        if pid.isdigit() and int(pid) in existing
+    ]
+    if rows:
+        op.bulk_insert(search_stats, rows)
+
+
+def downgrade() -> None:
+    op.drop_table('search_stats')
@@ -0,0 +1,91 @@
+"""normalize product images and sizes into child tables
+
+Revision ID: 0004_product_images_sizes
+Revises: 0003_search_stats
+Create Date: 2026-10-17 00:00:00
+
+"""
+import json
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004_product_images_sizes'
+down_revision = '0003_search_stats'
+branch_labels = None
+depends_on = None
+
+
+def _json_list(raw):
+    if not raw:
+        return []
+    try:
+        value = json.loads(raw)
+    except (TypeError, ValueError):
+        return []
+    return [str(item) for item in value] if isinstance(value, list) else []
+
+
+def upgrade() -> None:
+    product_images = op.create_table('product_images',
+        sa.Column('id', sa.Integer(), autoincrement=True, primary_key=True),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('path', sa.String(length=255), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False, server_default='0')
+    )
+    op.create_index('ix_product_images_product_id_position', 'product_images', ['product_id', 'position'])
+
+    product_sizes = op.create_table('product_sizes',
+        sa.Column('id', sa.Integer(), autoincrement=True, primary_key=True),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('size', sa.String(length=20), nullable=False),
+        sa.UniqueConstraint('product_id', 'size', name='uq_product_sizes_product_id_size')
+    )
+    op.create_index('ix_product_sizes_size_product_id', 'product_sizes', ['size', 'product_id'])
+
+    # Backfill from the JSON text columns
+    bind = op.get_bind()
+    image_rows, size_rows = [], []
+    for product_id, images, sizes in bind.execute(sa.text("SELECT id, images, sizes FROM products")):
+        for position, path in enumerate(dict.fromkeys(_json_list(images))):
+            image_rows.append({"product_id": product_id, "path": path, "position": position})
+        # The admin form used to store "7, 8, 9" as a single entry
+        split_sizes = [s for entry in _json_list(sizes) for s in re.split(r"[,\s]+", entry) if s]
+        for size in dict.fromkeys(split_sizes):
+            size_rows.append({"product_id": product_id, "size": size[:20]})
+    if image_rows:
+        op.bulk_insert(product_images, image_rows)
+    if size_rows:
+        op.bulk_insert(product_sizes, size_rows)
+
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.drop_column('images')
+        batch_op.drop_column('sizes')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.add_column(sa.Column('images', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('sizes', sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    images, sizes = {}, {}
+    for product_id, path in bind.execute(sa.text("SELECT product_id, path FROM product_images ORDER BY product_id, position")):
+        images.setdefault(product_id, []).append(path)
+    for product_id, size in bind.execute(sa.text("SELECT product_id, size FROM product_sizes ORDER BY id")):
+        sizes.setdefault(product_id, []).append(size)
+    for product_id in set(images) | set(sizes):
+        bind.execute(
+            sa.text("UPDATE products SET images = :images, sizes = :sizes WHERE id = :id"),
+            {
+                "id": product_id,
+                "images": json.dumps(images[product_id]) if product_id in images else None,
+                "sizes": json.dumps(sizes[product_id]) if product_id in sizes else None,
+            }
+        )
+
+    op.drop_index('ix_product_sizes_size_product_id', table_name='product_sizes')
+    op.drop_table('product_sizes')
+    op.drop_index('ix_product_images_product_id_position', table_name='product_images')
+    op.drop_table('product_images')
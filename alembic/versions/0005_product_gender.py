@@ -0,0 +1,77 @@
+"""products.gender column
+
+Revision ID: 0005_product_gender
+Revises: 0004_product_images_sizes
+Create Date: 2026-10-17 00:00:00
+
+"""
+import json
+import os
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005_product_gender'
+down_revision = '0004_product_images_sizes'
+branch_labels = None
+depends_on = None
+
+GENDERS = ("Male", "Female")
+
+# Legacy gender storage: a JSON map keyed by product id, and a tag that
+# edit_product appended to the description
+LEGACY_GENDER_MAP_FILE = os.path.join("analytics", "gender_map.json")
+GENDER_TAG_RE = re.compile(r"\s*Gender:\s*(Male|Female)\s*")
+
+
+def _load_legacy_map() -> dict:
+    if not os.path.exists(LEGACY_GENDER_MAP_FILE):
+        return {}
+    try:
+        with open(LEGACY_GENDER_MAP_FILE, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Entries written before the product was flushed are keyed "None"; skip them
+    return {int(pid): gender for pid, gender in legacy.items() if pid.isdigit() and gender in GENDERS}
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.add_column(sa.Column('gender', sa.String(length=10), nullable=True))
+        batch_op.create_index('ix_products_gender', ['gender'])
+
+    bind = op.get_bind()
+    legacy_map = _load_legacy_map()
+    for product_id, description in bind.execute(sa.text("SELECT id, description FROM products")).fetchall():
+        gender = legacy_map.get(product_id)
+        tags = GENDER_TAG_RE.findall(description or "")
+        if tags:
+            # The description tag is written on edit, so it is newer than the map
+            gender = tags[-1]
+            description = GENDER_TAG_RE.sub("\n", description).strip() or None
+            bind.execute(
+                sa.text("UPDATE products SET gender = :gender, description = :description WHERE id = :id"),
+                {"gender": gender, "description": description, "id": product_id}
+            )
+        elif gender:
+            bind.execute(
+                sa.text("UPDATE products SET gender = :gender WHERE id = :id"),
+                {"gender": gender, "id": product_id}
+            )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    rows = bind.execute(sa.text("SELECT id, description, gender FROM products WHERE gender IS NOT NULL")).fetchall()
+    for product_id, description, gender in rows:
+        tagged = f"{description}\nGender: {gender}" if description else f"Gender: {gender}"
+        bind.execute(
+            sa.text("UPDATE products SET description = :description WHERE id = :id"),
+            {"description": tagged, "id": product_id}
+        )
+
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.drop_index('ix_products_gender')
+        batch_op.drop_column('gender')
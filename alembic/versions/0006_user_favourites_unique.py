@@ -0,0 +1,27 @@
+"""unique (user_id, product_id) on user_favourites
+
+Revision ID: 0006_user_favourites_unique
+Revises: 0005_product_gender
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006_user_favourites_unique'
+down_revision = '0005_product_gender'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The old check-then-insert could race into duplicates; keep the earliest row of each pair
+    op.execute(sa.text(
+        "DELETE FROM user_favourites WHERE id NOT IN ("
+        "SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM user_favourites GROUP BY user_id, product_id) AS keep)"
+    ))
+    op.create_index('uq_user_favourites_user_id_product_id', 'user_favourites', ['user_id', 'product_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_user_favourites_user_id_product_id', table_name='user_favourites')
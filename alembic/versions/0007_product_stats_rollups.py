@@ -0,0 +1,76 @@
+"""product_stats and product_stats_daily rollups (replace search_stats)
+
+Revision ID: 0007_product_stats_rollups
+Revises: 0006_user_favourites_unique
+Create Date: 2026-10-17 00:00:00
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007_product_stats_rollups'
+down_revision = '0006_user_favourites_unique'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('product_stats',
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('search_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('favourite_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=False)
+    )
+    op.create_index('ix_product_stats_ranking', 'product_stats', ['search_count', 'favourite_count'])
+
+    op.create_table('product_stats_daily',
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('searches', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('favourites', sa.Integer(), nullable=False, server_default='0')
+    )
+    op.create_index('ix_product_stats_daily_day', 'product_stats_daily', ['day'])
+
+    # Seed the totals from search_stats and the current favourites. Past
+    # activity has no dates, so trends start empty.
+    bind = op.get_bind()
+    searches = dict(bind.execute(sa.text(
+        "SELECT s.product_id, s.search_count FROM search_stats s JOIN products p ON p.id = s.product_id"
+    )).fetchall())
+    favourites = dict(bind.execute(sa.text(
+        "SELECT f.product_id, COUNT(*) FROM user_favourites f JOIN products p ON p.id = f.product_id "
+        "GROUP BY f.product_id"
+    )).fetchall())
+    now = datetime.now()
+    rows = [
+        {"product_id": pid, "search_count": int(searches.get(pid, 0)),
+         "favourite_count": int(favourites.get(pid, 0)), "updated_at": now}
+        for pid in sorted(set(searches) | set(favourites))
+    ]
+    if rows:
+        op.bulk_insert(sa.table('product_stats',
+            sa.column('product_id', sa.Integer()),
+            sa.column('search_count', sa.Integer()),
+            sa.column('favourite_count', sa.Integer()),
+            sa.column('updated_at', sa.DateTime()),
+        ), rows)
+
+    op.drop_table('search_stats')
+
+
+def downgrade() -> None:
+    op.create_table('search_stats',
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('search_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=False)
+    )
+    op.execute(sa.text(
+        "INSERT INTO search_stats (product_id, search_count, updated_at) "
+        "SELECT product_id, search_count, updated_at FROM product_stats WHERE search_count > 0"
+    ))
+    op.drop_index('ix_product_stats_daily_day', table_name='product_stats_daily')
+    op.drop_table('product_stats_daily')
+    op.drop_index('ix_product_stats_ranking', table_name='product_stats')
+    op.drop_table('product_stats')
@@ -0,0 +1,40 @@
+"""indexes for hot catalog, favourites, upload and session-purge queries
+
+Revision ID: 0008_hot_query_indexes
+Revises: 0007_product_stats_rollups
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008_hot_query_indexes'
+down_revision = '0007_product_stats_rollups'
+branch_labels = None
+depends_on = None
+
+# Same expression as the purge query (is_active IS false / IS 0), so the planner can match it
+INACTIVE = sa.column("is_active", sa.Boolean()).is_(False)
+
+
+def upgrade() -> None:
+    # WHERE category = ? / status = ? ORDER BY id LIMIT n (catalog, dashboard)
+    op.create_index('ix_products_category_id', 'products', ['category', 'id'])
+    op.create_index('ix_products_status_id', 'products', ['status', 'id'])
+    # DELETE ... WHERE product_id = ? (product deletion); user_id lookups use the unique index
+    op.create_index('ix_user_favourites_product_id', 'user_favourites', ['product_id'])
+    # WHERE path = ? LIMIT 1 (is an upload still referenced?)
+    op.create_index('ix_product_images_path', 'product_images', ['path'])
+    # Session purge: expires_at < ? OR NOT is_active. Lookups use the unique session_id.
+    op.create_index('ix_sessions_expires_at', 'sessions', ['expires_at'])
+    op.create_index('ix_sessions_inactive', 'sessions', ['id'],
+                    postgresql_where=INACTIVE, sqlite_where=INACTIVE)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sessions_inactive', table_name='sessions')
+    op.drop_index('ix_sessions_expires_at', table_name='sessions')
+    op.drop_index('ix_product_images_path', table_name='product_images')
+    op.drop_index('ix_user_favourites_product_id', table_name='user_favourites')
+    op.drop_index('ix_products_status_id', table_name='products')
+    op.drop_index('ix_products_category_id', table_name='products')
@@ -0,0 +1,21 @@
+"""index feedback (created_at, id) for the paged inbox
+
+Revision ID: 0009_feedback_created_at_index
+Revises: 0008_hot_query_indexes
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+
+revision = '0009_feedback_created_at_index'
+down_revision = '0008_hot_query_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_feedback_created_at_id', 'feedback', ['created_at', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_feedback_created_at_id', table_name='feedback')
@@ -0,0 +1,202 @@
+"""Product analytics rollups.
+
+Search and favourite activity is kept pre-aggregated in two tables, so the
+analytics page never counts raw events:
+
+    product_stats        running totals per product, indexed for top-N queries
+    product_stats_daily  searches and favourites added per product per day,
+                         summed into daily or weekly trend buckets
+
+Catalog searches record the product ids they showed with ``search_counter.record``,
+which only bumps an in-memory counter. A background task flushes the pending
+counts every ``SEARCH_STATS_FLUSH_SECONDS`` as multi-row upserts. Favourite
+changes call ``bump_stats`` in the same transaction as the favourite row. The
+upserts add to the stored counts, so any number of uvicorn workers can write
+concurrently without losing updates.
+"""
+import asyncio
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app import database
+from app.models import Product, ProductStat, ProductStatDaily
+
+logger = logging.getLogger(__name__)
+
+SEARCH_STATS_FLUSH_SECONDS = float(os.getenv("SEARCH_STATS_FLUSH_SECONDS", "10"))
+
+
+TREND_BUCKETS = ("day", "week")
+
+
+def _upsert_statement(dialect: str, table):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(table)
+
+
+def _add_to_counts(db: Session, model, key_columns: List[str], rows: List[dict], counters: List[str]) -> None:
+    """Insert ``rows`` into ``model``'s table, adding ``counters`` to existing rows with the same key"""
+    table = model.__table__
+    stmt = _upsert_statement(db.get_bind().dialect.name, table)
+    if stmt is not None:
+        stmt = stmt.values(rows)
+        updates = {name: table.c[name] + stmt.excluded[name] for name in counters}
+        if "updated_at" in table.c:
+            updates["updated_at"] = stmt.excluded.updated_at
+        db.execute(stmt.on_conflict_do_update(index_elements=key_columns, set_=updates))
+        return
+    for row in rows:
+        updates = {table.c[name]: table.c[name] + row[name] for name in counters}
+        if "updated_at" in row:
+            updates[table.c.updated_at] = row["updated_at"]
+        query = db.query(model).filter(*(table.c[k] == row[k] for k in key_columns))
+        if not query.update(updates, synchronize_session=False):
+            db.add(model(**row))
+
+
+def bump_stats(db: Session, searches: Optional[Dict[int, int]] = None,
+               favourites: Optional[Dict[int, int]] = None, day: Optional[date] = None) -> None:
+    """Add search counts and favourite changes ({product_id: n}) to both rollup tables.
+
+    Does not commit, so favourite changes land in the caller's transaction.
+    Negative favourite changes (removals) lower the total but not the day's
+    "favourites added" bucket.
+    """
+    searches = searches or {}
+    favourites = favourites or {}
+    product_ids = set(searches) | set(favourites)
+    if not product_ids:
+        return
+    now = datetime.now()
+    day = day or now.date()
+    _add_to_counts(db, ProductStat, ["product_id"], [
+        {"product_id": pid, "search_count": searches.get(pid, 0),
+         "favourite_count": favourites.get(pid, 0), "updated_at": now}
+        for pid in sorted(product_ids)
+    ], ["search_count", "favourite_count"])
+    daily = [
+        {"product_id": pid, "day": day, "searches": searches.get(pid, 0),
+         "favourites": max(favourites.get(pid, 0), 0)}
+        for pid in sorted(product_ids)
+        if searches.get(pid, 0) or favourites.get(pid, 0) > 0
+    ]
+    if daily:
+        _add_to_counts(db, ProductStatDaily, ["product_id", "day"], daily, ["searches", "favourites"])
+
+
+def add_search_counts(db: Session, counts: Dict[int, int]) -> None:
+    """Atomically add ``counts`` ({product_id: n}) to the rollups and commit"""
+    if not counts:
+        return
+    # Products deleted since the searches were recorded would violate the FK
+    existing = {pid for (pid,) in db.query(Product.id).filter(Product.id.in_(list(counts))).all()}
+    counts = {pid: n for pid, n in counts.items() if pid in existing}
+    if not counts:
+        return
+    bump_stats(db, searches=counts)
+    db.commit()
+
+
+def trend_buckets(rows: Iterable[Tuple[date, int, int]], since: date, until: date,
+                  bucket: str = "day") -> List[dict]:
+    """Group (day, searches, favourites) rows into consecutive day or week buckets, zeros included"""
+    def start_of(day: date) -> date:
+        return day - timedelta(days=day.weekday()) if bucket == "week" else day
+
+    step = timedelta(days=7 if bucket == "week" else 1)
+    buckets = {}
+    current = start_of(since)
+    while current <= until:
+        buckets[current] = {"start": current, "searches": 0, "favourites": 0}
+        current += step
+    for day, searches, favourites in rows:
+        if isinstance(day, str):  # SQLite returns aggregated dates as text
+            day = date.fromisoformat(day)
+        entry = buckets.get(start_of(day))
+        if entry is not None:
+            entry["searches"] += int(searches or 0)
+            entry["favourites"] += int(favourites or 0)
+    return list(buckets.values())
+
+
+class SearchCounter:
+    """In-memory search count aggregator with periodic batched flushes"""
+
+    def __init__(self, interval: float = SEARCH_STATS_FLUSH_SECONDS):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+        # Totals since startup, for /metrics
+        self.searches = 0
+        self.flushed = 0
+        self.flush_failures = 0
+
+    def record(self, product_ids: Iterable[int]) -> None:
+        """Count one search impression for each product id"""
+        with self._lock:
+            self._pending.update(product_ids)
+            self.searches += 1
+
+    def pending(self) -> Dict[int, int]:
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self) -> int:
+        """Write pending counts to the database; returns the number of products flushed"""
+        with self._lock:
+            batch, self._pending = self._pending, Counter()
+        if not batch:
+            return 0
+        if database.SessionLocal is None:
+            return 0
+
+        db = database.SessionLocal()
+        try:
+            add_search_counts(db, batch)
+            self.flushed += len(batch)
+            return len(batch)
+        except Exception as e:
+            db.rollback()
+            self.flush_failures += 1
+            logger.warning("failed to flush search stats: %s", e)
+            # Put the batch back so the next flush retries it
+            with self._lock:
+                self._pending.update(batch)
+            return 0
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await run_in_threadpool(self.flush)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await run_in_threadpool(self.flush)
+
+
+search_counter = SearchCounter()
@@ -0,0 +1,69 @@
+"""Scheduled retention cleanup.
+
+    purge_sessions  delete logged-out sessions, and sessions that expired more
+                    than SESSION_PURGE_GRACE_SECONDS ago
+    purge_feedback  delete feedback older than FEEDBACK_RETENTION_DAYS; off
+                    unless set (unset or 0 keeps feedback forever), and every
+                    run that deletes messages is logged
+
+Both delete in chunks of CLEANUP_BATCH_SIZE rows, one short transaction per
+chunk, and stop after CLEANUP_MAX_BATCHES chunks per run so a large backlog
+is worked off over several runs instead of holding locks for long.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, or_, select
+
+from app import database
+from app.models import Feedback, Session
+from app.scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+CLEANUP_INTERVAL_SECONDS = int(os.getenv("CLEANUP_INTERVAL_SECONDS", "900"))
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "1000"))
+CLEANUP_MAX_BATCHES = int(os.getenv("CLEANUP_MAX_BATCHES", "50"))
+SESSION_PURGE_GRACE_SECONDS = int(os.getenv("SESSION_PURGE_GRACE_SECONDS", "3600"))
+FEEDBACK_RETENTION_DAYS = int(os.getenv("FEEDBACK_RETENTION_DAYS") or "0")
+
+
+async def delete_in_batches(model, *conditions, batch_size: int = CLEANUP_BATCH_SIZE,
+                            max_batches: int = CLEANUP_MAX_BATCHES) -> int:
+    """Delete rows of ``model`` matching ``conditions``, ``batch_size`` ids per transaction"""
+    deleted = 0
+    for _ in range(max_batches):
+        async with database.AsyncSessionLocal() as db:
+            ids = select(model.id).where(*conditions).limit(batch_size).scalar_subquery()
+            result = await db.execute(delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False))
+            await db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            break
+        # Let request handlers in between chunks
+        await asyncio.sleep(0)
+    return deleted
+
+
+async def purge_sessions() -> int:
+    cutoff = datetime.now() - timedelta(seconds=SESSION_PURGE_GRACE_SECONDS)
+    return await delete_in_batches(Session, or_(Session.expires_at < cutoff, Session.is_active.is_(False)))
+
+
+async def purge_feedback(retention_days: int = FEEDBACK_RETENTION_DAYS) -> int:
+    if retention_days <= 0:
+        return 0
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    deleted = await delete_in_batches(Feedback, Feedback.created_at < cutoff)
+    if deleted:
+        logger.info("Deleted %d feedback messages received before %s (FEEDBACK_RETENTION_DAYS=%d)",
+                    deleted, cutoff.strftime("%Y-%m-%d %H:%M"), retention_days)
+    return deleted
+
+
+def register(scheduler: Scheduler) -> None:
+    scheduler.add("purge_sessions", CLEANUP_INTERVAL_SECONDS, purge_sessions)
+    if FEEDBACK_RETENTION_DAYS > 0:
+        scheduler.add("purge_feedback", CLEANUP_INTERVAL_SECONDS, purge_feedback)
@@ -0,0 +1,313 @@
+"""Write-behind queue for contact-form submissions.
+
+``submit_contact`` hands each message to ``feedback_queue.submit``, which
+appends it to this worker's spool file (fsynced) and to an in-memory list,
+then returns so the visitor is acknowledged at once. A background task
+writes pending rows every ``FEEDBACK_FLUSH_SECONDS`` (sooner once
+``FEEDBACK_FLUSH_BATCH`` are waiting) as one multi-row INSERT, then rewrites
+the spool with whatever is still pending.
+
+Every worker owns one spool file in ``FEEDBACK_SPOOL_DIR``, held with an
+exclusive ``flock``. At startup a worker adopts spool files no live process
+holds (left by a crash or restart) and writes their rows too. Delivery is
+at-least-once: a crash between the INSERT commit and the spool rewrite
+replays that batch after restart.
+
+``submit`` returns False when ``FEEDBACK_QUEUE_MAX`` rows are already pending
+or the spool cannot be written; the caller then inserts synchronously. It
+raises ``FeedbackRejected`` for a submission that does not fit the
+``feedback`` columns, so nothing unwritable reaches the spool.
+
+If a batch INSERT fails on its data, its rows are retried one at a time;
+rows the database still refuses are moved to ``FEEDBACK_DEAD_LETTER_FILE``
+in the spool directory instead of blocking the queue. Other errors (the
+database being unreachable) leave the batch pending for the next flush.
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from app import database
+from app.models import Feedback
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process is assumed
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_QUEUE_ENABLED = os.getenv("FEEDBACK_QUEUE_ENABLED", "true").lower() == "true"
+FEEDBACK_QUEUE_MAX = int(os.getenv("FEEDBACK_QUEUE_MAX", "1000"))
+FEEDBACK_FLUSH_SECONDS = float(os.getenv("FEEDBACK_FLUSH_SECONDS", "2"))
+FEEDBACK_FLUSH_BATCH = int(os.getenv("FEEDBACK_FLUSH_BATCH", "200"))
+FEEDBACK_SPOOL_DIR = os.getenv("FEEDBACK_SPOOL_DIR", "spool")
+
+FEEDBACK_DEAD_LETTER_FILE = "dead-letter.jsonl"
+
+SPOOL_PATTERN = "feedback-*.jsonl"
+
+
+class FeedbackRejected(ValueError):
+    """Raised when a submission cannot be stored, e.g. a name longer than the column"""
+
+
+def validate(name: str, email: str, message: str) -> None:
+    """Raise ``FeedbackRejected`` unless the values fit the ``feedback`` columns"""
+    for column, value in (("name", name), ("email", email), ("message", message)):
+        length = Feedback.__table__.c[column].type.length
+        if length is not None and len(value) > length:
+            raise FeedbackRejected(f"{column} is longer than {length} characters")
+
+
+def _encode(row: dict) -> str:
+    return json.dumps({**row, "created_at": row["created_at"].isoformat()}) + "\n"
+
+
+def _read_spool(path: str) -> List[dict]:
+    """Rows of a spool file; a torn last line from a crash mid-write is skipped"""
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+                row["created_at"] = datetime.fromisoformat(row["created_at"])
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Skipping unreadable line in %s", path)
+                continue
+            rows.append(row)
+    return rows
+
+
+class FeedbackQueue:
+    """Durable in-process buffer of Feedback rows, flushed in batches"""
+
+    def __init__(self, spool_dir: str = FEEDBACK_SPOOL_DIR, max_pending: int = FEEDBACK_QUEUE_MAX,
+                 interval: float = FEEDBACK_FLUSH_SECONDS, batch_size: int = FEEDBACK_FLUSH_BATCH):
+        self.spool_dir = spool_dir
+        self.max_pending = max_pending
+        self.interval = interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        # One flush at a time: stop() may run while a cancelled loop's flush is still in its thread
+        self._flush_lock = threading.Lock()
+        self._pending: List[dict] = []
+        self._spool = None
+        self._spool_path: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.submitted = 0
+        self.flushed = 0
+        self.rejected = 0
+        self.dead_lettered = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def running(self) -> bool:
+        return self._spool is not None
+
+    def _open_spool(self) -> None:
+        os.makedirs(self.spool_dir, exist_ok=True)
+        name = f"feedback-{os.getpid()}-{int(time.time())}.jsonl"
+        # Lock under a name _adopt_orphans ignores, then rename: no other worker can
+        # see the spool before it is locked and take it for an orphan
+        temporary = os.path.join(self.spool_dir, f".{name}.tmp")
+        spool = open(temporary, "a+", encoding="utf-8")
+        try:
+            if fcntl is not None:
+                fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            path = os.path.join(self.spool_dir, name)
+            os.rename(temporary, path)
+        except OSError:
+            spool.close()
+            os.remove(temporary)
+            raise
+        self._spool = spool
+        self._spool_path = path
+
+    def _adopt_orphans(self) -> int:
+        """Take over spool files of processes that are gone; returns rows recovered"""
+        recovered = 0
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, SPOOL_PATTERN))):
+            if path == self._spool_path:
+                continue
+            with open(path, "r+", encoding="utf-8") as orphan:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(orphan, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue  # a live worker owns it
+                rows = _read_spool(path)
+                self._append(rows)
+                os.remove(path)
+            recovered += len(rows)
+        return recovered
+
+    def _append(self, rows: List[dict]) -> None:
+        """Durably add rows to the spool and the pending list"""
+        if not rows:
+            return
+        with self._lock:
+            self._spool.write("".join(_encode(row) for row in rows))
+            self._spool.flush()
+            os.fsync(self._spool.fileno())
+            self._pending.extend(rows)
+
+    def _submit(self, row: dict) -> bool:
+        if self._spool is None or len(self._pending) >= self.max_pending:
+            return False
+        try:
+            self._append([row])
+        except OSError as e:
+            logger.warning("Could not spool feedback, writing it directly: %s", e)
+            return False
+        return True
+
+    async def submit(self, name: str, email: str, message: str) -> bool:
+        """Queue a submission; False means the caller must write it synchronously"""
+        validate(name, email, message)
+        row = {"name": name, "email": email, "message": message, "created_at": datetime.now()}
+        if not await run_in_threadpool(self._submit, row):
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    def flush(self) -> int:
+        """Insert pending rows in batches; returns how many were written"""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        written = 0
+        while True:
+            with self._lock:
+                batch = self._pending[:self.batch_size]
+            if not batch or database.SessionLocal is None:
+                return written
+            db = database.SessionLocal()
+            try:
+                db.execute(insert(Feedback.__table__).values(batch))
+                db.commit()
+                done, dead = len(batch), []
+            except (DataError, IntegrityError) as e:
+                db.rollback()
+                logger.warning("Feedback batch of %s rejected, retrying rows one by one: %s", len(batch), e)
+                done, dead = self._insert_singly(db, batch)
+            except Exception as e:
+                db.rollback()
+                logger.warning("Failed to flush %s feedback rows, will retry: %s", len(batch), e)
+                return written
+            finally:
+                db.close()
+            if dead:
+                self._dead_letter(dead)
+            with self._lock:
+                del self._pending[:done]
+                self._rewrite_spool()
+            written += done - len(dead)
+            self.flushed += done - len(dead)
+            if done < len(batch):
+                return written
+
+    def _insert_singly(self, db, batch: List[dict]):
+        """Insert rows one at a time; returns (rows handled, rows the database refused).
+
+        Stops early on errors that are not about the row itself; the rows
+        after that stay pending.
+        """
+        dead = []
+        for done, row in enumerate(batch):
+            try:
+                db.execute(insert(Feedback.__table__).values(row))
+                db.commit()
+            except (DataError, IntegrityError) as e:
+                db.rollback()
+                logger.error("Feedback from %s cannot be stored, moving it to the dead-letter file: %s",
+                             row.get("email"), e)
+                dead.append(row)
+            except Exception as e:
+                db.rollback()
+                logger.warning("Failed to flush feedback rows, will retry: %s", e)
+                return done, dead
+        return len(batch), dead
+
+    def _dead_letter(self, rows: List[dict]) -> None:
+        with open(os.path.join(self.spool_dir, FEEDBACK_DEAD_LETTER_FILE), "a", encoding="utf-8") as f:
+            f.write("".join(_encode(row) for row in rows))
+            f.flush()
+            os.fsync(f.fileno())
+        self.dead_lettered += len(rows)
+
+    def _rewrite_spool(self) -> None:
+        """Replace the spool's contents with the rows still pending (lock held)"""
+        self._spool.seek(0)
+        self._spool.truncate()
+        self._spool.write("".join(_encode(row) for row in self._pending))
+        self._spool.flush()
+        os.fsync(self._spool.fileno())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await run_in_threadpool(self.flush)
+
+    async def start(self) -> None:
+        if not FEEDBACK_QUEUE_ENABLED or self._task is not None:
+            return
+        try:
+            await run_in_threadpool(self._open_spool)
+            recovered = await run_in_threadpool(self._adopt_orphans)
+        except OSError as e:
+            logger.warning("Feedback spool unavailable, contact form writes directly: %s", e)
+            self._spool = None
+            return
+        if recovered:
+            logger.info("Recovered %s spooled feedback messages", recovered)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._spool is None:
+            return
+        await run_in_threadpool(self.flush)
+        with self._lock:
+            spool, self._spool = self._spool, None
+            empty = not self._pending
+        spool.close()
+        if empty:
+            os.remove(self._spool_path)
+
+    def stats(self) -> dict:
+        return {"depth": self.depth, "max": self.max_pending, "submitted": self.submitted,
+                "flushed": self.flushed, "written_directly": self.rejected,
+                "dead_lettered": self.dead_lettered}
+
+
+feedback_queue = FeedbackQueue()
@@ -0,0 +1,194 @@
+"""Responsive image derivatives.
+
+Uploaded product photos are often multi-megabyte. For every upload a
+background worker pool renders resized copies at ``DERIVATIVE_WIDTHS`` in
+each of ``IMAGE_DERIVATIVE_FORMATS`` (WebP by default; AVIF when enabled and
+supported by Pillow). Templates reference them through the
+``image_srcset`` helper and the browser picks the smallest one that fits.
+
+Derivatives live under ``static/derived/<width>/<upload name>.<format>`` and
+are served by ``GET /images/<width>/<upload name>.<format>``. A derivative
+that does not exist yet (an upload made before this pipeline, or one whose
+job is still queued) is rendered on that first request. Upload names are
+content hashes, so responses are cached as immutable.
+
+Only still formats Pillow decodes (``RENDERABLE_EXTENSIONS``) get a srcset;
+older uploads in other formats (SVG, HEIC, animated GIF) keep a plain
+``<img>``, since browsers do not fall back from a failing ``<source>``. A
+derivative that still cannot be rendered redirects (307) to the original.
+
+Requires Pillow; without it ``image_srcset`` returns "" and pages keep
+serving the original uploads.
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, RedirectResponse
+
+from app.uploads import UPLOADS_DIR, UPLOADS_URL
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # optional dependency
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+DERIVED_DIR = "static/derived"
+DERIVED_URL = "/images/"
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+DERIVATIVE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+MEDIA_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+# Uploads rendered into derivatives; GIF is left out so animations keep playing
+RENDERABLE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def _enabled_formats() -> List[str]:
+    if Image is None:
+        return []
+    requested = [f.strip().lower() for f in os.getenv("IMAGE_DERIVATIVE_FORMATS", "webp").split(",")]
+    return [f for f in requested if f in MEDIA_TYPES and features.check(f)]
+
+
+IMAGE_DERIVATIVE_FORMATS = _enabled_formats()
+
+
+def _upload_name(url: Optional[str]) -> Optional[str]:
+    """File name of a /static/uploads URL, or None for external image URLs"""
+    if not url or not url.startswith(UPLOADS_URL):
+        return None
+    name = url[len(UPLOADS_URL):]
+    return name if name and name == os.path.basename(name) else None
+
+
+def _renderable(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in RENDERABLE_EXTENSIONS
+
+
+def derivative_path(name: str, width: int, fmt: str) -> str:
+    return os.path.join(DERIVED_DIR, str(width), f"{name}.{fmt}")
+
+
+def image_srcset(url: Optional[str], fmt: str = "webp") -> str:
+    """srcset value listing every width of ``url`` in ``fmt``; "" if there are none"""
+    name = _upload_name(url)
+    if name is None or fmt not in IMAGE_DERIVATIVE_FORMATS or not _renderable(name):
+        return ""
+    return ", ".join(f"{DERIVED_URL}{width}/{name}.{fmt} {width}w" for width in DERIVATIVE_WIDTHS)
+
+
+def _render(source: str, dest: str, width: int, fmt: str) -> str:
+    """Write a ``width``-wide copy of ``source`` to ``dest`` (never upscaled)"""
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.tmp-{threading.get_ident()}"
+        image.save(tmp, format=fmt.upper(), quality=IMAGE_QUALITY)
+    os.replace(tmp, dest)
+    return dest
+
+
+class DerivativeWorker:
+    """Thread pool rendering derivatives; concurrent requests for one file share a job"""
+
+    def __init__(self, workers: int = IMAGE_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="images")
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+        # Uploads Pillow failed to decode; not retried until restart
+        self.failed: Set[str] = set()
+
+    def submit(self, name: str, width: int, fmt: str) -> Future:
+        dest = derivative_path(name, width, fmt)
+        with self._lock:
+            future = self._pending.get(dest)
+            if future is None:
+                future = self._executor.submit(_render, os.path.join(UPLOADS_DIR, name), dest, width, fmt)
+                self._pending[dest] = future
+                future.add_done_callback(lambda f, key=dest, upload=name: self._finished(key, upload, f))
+            return future
+
+    def _finished(self, dest: str, name: str, future: Future) -> None:
+        with self._lock:
+            self._pending.pop(dest, None)
+            if future.exception() is not None:
+                self.failed.add(name)
+        if future.exception() is not None:
+            logger.warning("Could not render %s: %s", dest, future.exception())
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    async def ensure(self, name: str, width: int, fmt: str) -> str:
+        """Path of the derivative, rendering it first if needed"""
+        dest = derivative_path(name, width, fmt)
+        if os.path.exists(dest):
+            return dest
+        return await asyncio.wrap_future(self.submit(name, width, fmt))
+
+
+derivative_worker = DerivativeWorker()
+
+
+def generate_derivatives(urls: Iterable[str]) -> None:
+    """Queue every derivative of freshly uploaded images; returns immediately"""
+    for url in urls:
+        name = _upload_name(url)
+        if name is None or not _renderable(name):
+            continue
+        for fmt in IMAGE_DERIVATIVE_FORMATS:
+            for width in DERIVATIVE_WIDTHS:
+                if not os.path.exists(derivative_path(name, width, fmt)):
+                    derivative_worker.submit(name, width, fmt)
+
+
+def remove_derivatives(url: str) -> None:
+    """Delete the derivatives of an upload that was removed from disk"""
+    name = _upload_name(url)
+    if name is None:
+        return
+    for fmt in MEDIA_TYPES:
+        for width in DERIVATIVE_WIDTHS:
+            try:
+                os.remove(derivative_path(name, width, fmt))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Could not delete derivative of %s: %s", name, e)
+
+
+router = APIRouter(prefix="/images", tags=["Images"])
+
+
+@router.get("/{width}/{filename}")
+async def derivative(width: int, filename: str):
+    """Serve a resized copy of an upload, rendering it on first request.
+
+    Uploads that cannot be rendered redirect to the original file.
+    """
+    name, _, fmt = filename.rpartition(".")
+    if (width not in DERIVATIVE_WIDTHS or fmt not in IMAGE_DERIVATIVE_FORMATS
+            or not name or name != os.path.basename(name)
+            or not os.path.isfile(os.path.join(UPLOADS_DIR, name))):
+        raise HTTPException(status_code=404, detail="Image not found")
+    original = RedirectResponse(UPLOADS_URL + name, status_code=307)
+    if not _renderable(name) or name in derivative_worker.failed:
+        return original
+    try:
+        path = await derivative_worker.ensure(name, width, fmt)
+    except Exception:
+        return original
+    return FileResponse(path, media_type=MEDIA_TYPES[fmt], headers={"Cache-Control": DERIVATIVE_CACHE_CONTROL})
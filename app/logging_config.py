@@ -0,0 +1,96 @@
+"""Application logging.
+
+``setup_logging()`` runs once when ``app.main`` is imported. Modules log
+through ``logging.getLogger(__name__)``; the root logger only holds a
+``QueueHandler``, so a request handler merely enqueues a record and a
+``QueueListener`` thread formats it and writes it to stderr. Debug calls use
+%-style arguments, so below the configured level they cost a level check.
+
+Environment:
+
+    LOG_LEVEL   level for the ``app.*`` loggers (default INFO)
+    LOG_LEVELS  per-logger overrides, e.g. ``app.routers.products=DEBUG,sqlalchemy.engine=INFO``
+    LOG_FORMAT  ``text`` (default) or ``json``, one object per line
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, for log collectors"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def _level(name: str) -> Optional[int]:
+    value = logging.getLevelName(name.strip().upper())
+    return value if isinstance(value, int) else None
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """Parse ``name=LEVEL,name=LEVEL``; unknown levels are skipped"""
+    levels = {}
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        value = _level(level) if sep else None
+        if name.strip() and value is not None:
+            levels[name.strip()] = value
+    return levels
+
+
+def setup_logging() -> None:
+    """Route all logging through a queue to one stderr handler"""
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(sys.stderr)
+    if LOG_FORMAT.lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(logging.WARNING)
+    logging.getLogger("app").setLevel(_level(LOG_LEVEL) or logging.INFO)
+    for name, level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,19 +1,31 @@
-from fastapi import FastAPI, Request, Depends, status
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from fastapi import FastAPI, Request, Depends, HTTPException, Query, status
 from fastapi.responses import HTMLResponse, JSONResponse
 from app.database import engine, Base, get_db
+from app.logging_config import setup_logging
+from app.page_cache import PageCache
+from app import images, metrics, sql_profiler, static_assets, uploads
 from app.routers import auth, products
+from app.templating import templates
 import uvicorn
 from starlette.responses import RedirectResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
 import os
+from datetime import datetime, timedelta
+from typing import Optional
 from starlette.middleware.cors import CORSMiddleware
-from starlette.middleware.gzip import GZipMiddleware
 from starlette.middleware.trustedhost import TrustedHostMiddleware
 
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Admin feedback inbox
+FEEDBACK_PAGE_SIZE = int(os.getenv("FEEDBACK_PAGE_SIZE", "48"))
+FEEDBACK_PREVIEW_CHARS = 100
+
 # Database tables are managed by init_schema.py
 # Base.metadata.create_all(bind=engine)
 
@@ -23,15 +35,20 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Mount static files (hashed URLs via static_url, precompressed siblings)
+app.mount("/static", static_assets.StaticAssets(directory="static"), name="static")
+
+# Marketing pages render identically for every visitor; serve them pre-rendered
+marketing_pages = PageCache(templates, [
+    "home.html", "about.html", "faq.html", "shipping.html", "returns.html",
+    "privacy.html", "terms.html", "cookies.html", "size_guide.html",
+])
 
 # Include routers
 app.include_router(auth.router)
 app.include_router(products.router)
+app.include_router(images.router)
 
-# Templates
-templates = Jinja2Templates(directory="templates")
 
 # Note: Session management is now handled client-side via JavaScript
 # The middleware has been removed to improve performance
@@ -54,7 +71,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.add_middleware(GZipMiddleware, minimum_size=500)
+app.add_middleware(
+    static_assets.DynamicGZipMiddleware,
+    exclude_prefixes=(static_assets.STATIC_URL, images.DERIVED_URL),
+    minimum_size=500,
+)
 
 trusted_hosts = ["*"]
 if render_url and "://" in render_url:
@@ -62,6 +83,26 @@ if render_url and "://" in render_url:
     trusted_hosts = [host]
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=trusted_hosts)
 
+# Refuse oversized multipart bodies before Starlette spools them to disk
+app.add_middleware(uploads.UploadSizeLimitMiddleware)
+
+# Per-request SQL counts and timings, sent back as Server-Timing
+sql_profiler.install()
+app.add_middleware(sql_profiler.ProfilerMiddleware)
+
+# Outermost, so latencies and status codes include every other middleware
+app.add_middleware(metrics.MetricsMiddleware)
+
+@app.on_event("startup")
+def prepare_static_assets():
+    """Precompress text assets and hash everything for static_url."""
+    static_assets.prepare()
+
+@app.on_event("startup")
+def prerender_marketing_pages():
+    """Render the marketing pages once, after the asset manifest is built."""
+    marketing_pages.prerender()
+
 @app.on_event("startup")
 def ensure_admin_user():
     """Create initial admin from env if none exists."""
@@ -86,17 +127,64 @@ def ensure_admin_user():
     finally:
         db.close()
 
+@app.on_event("startup")
+async def start_search_stats_flusher():
+    """Start the periodic flush of buffered search counts."""
+    from app.analytics import search_counter
+    search_counter.start()
+
+@app.on_event("shutdown")
+async def stop_search_stats_flusher():
+    """Flush any search counts still buffered in this worker."""
+    from app.analytics import search_counter
+    await search_counter.stop()
+
+@app.on_event("startup")
+async def start_feedback_queue():
+    """Recover spooled contact messages and start the batched feedback writer."""
+    from app.feedback_queue import feedback_queue
+    await feedback_queue.start()
+
+@app.on_event("shutdown")
+async def stop_feedback_queue():
+    """Write the contact messages still queued in this worker."""
+    from app.feedback_queue import feedback_queue
+    await feedback_queue.stop()
+
+@app.on_event("startup")
+async def start_scheduler():
+    """Start periodic cleanup jobs (they run only in the leader worker)."""
+    from app import cleanup
+    from app.scheduler import scheduler
+    cleanup.register(scheduler)
+    scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    """Stop scheduled jobs and give up the leader lock."""
+    from app.scheduler import scheduler
+    await scheduler.stop()
+
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    from app.feedback_queue import feedback_queue
+    from app.password_pool import password_pool
+    from app.scheduler import scheduler
+    return {"status": "ok", "password_pool": password_pool.stats(), "scheduler": scheduler.stats(),
+            "feedback_queue": feedback_queue.stats()}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    """Prometheus metrics for this worker"""
+    if metrics.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.get("/", response_class=HTMLResponse)
 async def home_page(request: Request):
     """Home page with hero banner and categories"""
-    return templates.TemplateResponse("home.html", {
-        "request": request
-    })
+    return marketing_pages.response(request, "home.html")
 
 @app.get("/catalog", response_class=HTMLResponse)
 async def catalog_redirect(request: Request):
@@ -116,9 +204,7 @@ async def admin_users_redirect(request: Request):
 @app.get("/size-guide", response_class=HTMLResponse)
 async def size_guide_page(request: Request):
     """Size guide page with shoe sizing information"""
-    return templates.TemplateResponse("size_guide.html", {
-        "request": request
-    })
+    return marketing_pages.response(request, "size_guide.html")
 
 @app.get("/contact", response_class=HTMLResponse)
 async def contact_page(request: Request):
@@ -128,7 +214,7 @@ async def contact_page(request: Request):
     })
 
 @app.post("/contact", response_class=HTMLResponse)
-async def submit_contact(request: Request, db: Session = Depends(get_db)):
+async def submit_contact(request: Request, db: AsyncSession = Depends(get_db)):
     """Handle contact form submission"""
     form = await request.form()
     
@@ -144,16 +230,22 @@ async def submit_contact(request: Request, db: Session = Depends(get_db)):
         # Combine first and last name
         full_name = f"{first_name} {last_name}".strip()
         
-        # Create feedback record
-        from app.models import Feedback
-        feedback = Feedback(
-            name=full_name,
-            email=email,
-            message=f"Subject: {subject}\nPhone: {phone}\n\nMessage:\n{message}"
-        )
+        body = f"Subject: {subject}\nPhone: {phone}\n\nMessage:\n{message}"
         
-        db.add(feedback)
-        db.commit()
+        # Spool it for the batched writer; write directly when the queue is full or off
+        from app.feedback_queue import FeedbackRejected, feedback_queue
+        try:
+            queued = await feedback_queue.submit(full_name, email, body)
+        except FeedbackRejected as e:
+            logger.info("Rejected contact form submission: %s", e)
+            return templates.TemplateResponse("contact.html", {
+                "request": request,
+                "error": "Please keep your name and email under 100 characters each."
+            })
+        if not queued:
+            from app.models import Feedback
+            db.add(Feedback(name=full_name, email=email, message=body))
+            await db.commit()
         
         # Return success response
         return templates.TemplateResponse("contact.html", {
@@ -162,65 +254,84 @@ async def submit_contact(request: Request, db: Session = Depends(get_db)):
         })
         
     except Exception as e:
-        db.rollback()
-        print(f"Error saving feedback: {e}")
+        await db.rollback()
+        logger.error("Error saving feedback: %s", e)
         return templates.TemplateResponse("contact.html", {
             "request": request,
             "error": "Sorry, there was an error sending your message. Please try again."
         })
 
 @app.get("/admin/feedback", response_class=HTMLResponse)
-async def admin_feedback_page(request: Request, db: Session = Depends(get_db)):
-    """Admin feedback management page"""
+async def admin_feedback_page(
+    request: Request,
+    before: Optional[datetime] = Query(None),
+    before_id: Optional[int] = Query(None),
+    limit: int = Query(FEEDBACK_PAGE_SIZE, ge=1, le=200),
+    db: AsyncSession = Depends(get_db)
+):
+    """Admin feedback inbox, newest first, paged by (created_at, id)"""
     try:
         # Check if user is admin
         from app.routers.auth import get_current_admin
-        current_admin = get_current_admin(request, db)
+        current_admin = await get_current_admin(request, db)
         
         if not current_admin:
             return RedirectResponse(url="/auth/login", status_code=status.HTTP_302_FOUND)
         
-        # Get all feedback with error handling
         from app.models import Feedback
         
-        # First, let's check what's in the database
-        all_feedback = db.query(Feedback).all()
-        print(f"DEBUG: Raw feedback count: {len(all_feedback)}")
-        
-        # Check for any None created_at values
-        for fb in all_feedback:
-            print(f"DEBUG: Feedback ID {fb.id}: created_at = {fb.created_at}")
+        # List columns plus a short preview; the modal fetches the full message.
+        # ix_feedback_created_at_id serves both the order and the cursor.
+        stmt = select(
+            Feedback.id, Feedback.name, Feedback.email, Feedback.created_at,
+            func.substr(Feedback.message, 1, FEEDBACK_PREVIEW_CHARS + 1).label("preview")
+        ).where(Feedback.created_at.isnot(None))
+        if before is not None and before_id is not None:
+            stmt = stmt.where(or_(
+                Feedback.created_at < before,
+                and_(Feedback.created_at == before, Feedback.id < before_id)
+            ))
+        rows = (await db.execute(
+            stmt.order_by(Feedback.created_at.desc(), Feedback.id.desc()).limit(limit + 1)
+        )).all()
+        feedback_list, more = rows[:limit], len(rows) > limit
+        next_cursor = (feedback_list[-1].created_at.isoformat(), feedback_list[-1].id) if more else None
         
-        # Order by created_at, handling None values
-        feedback_list = db.query(Feedback).filter(
-            Feedback.created_at.isnot(None)
-        ).order_by(Feedback.created_at.desc()).all()
+        week_ago = datetime.now() - timedelta(days=7)
+        total_count, week_count = (await db.execute(select(
+            func.count(Feedback.id),
+            func.count(Feedback.id).filter(Feedback.created_at >= week_ago)
+        ))).one()
         
-        print(f"DEBUG: Filtered feedback count: {len(feedback_list)}")
+        logger.debug("Feedback inbox: %s of %s messages", len(feedback_list), total_count)
         
         return templates.TemplateResponse("feedback.html", {
             "request": request,
-            "feedback_list": feedback_list
+            "feedback_list": feedback_list,
+            "preview_chars": FEEDBACK_PREVIEW_CHARS,
+            "total_count": total_count,
+            "week_count": week_count,
+            "is_first_page": before is None,
+            "next_cursor": next_cursor,
+            "page_size": limit
         })
     except Exception as e:
-        print(f"ERROR in admin_feedback_page: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error loading admin feedback page")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@app.get("/admin/feedback/{feedback_id}")
-async def get_feedback_detail(feedback_id: int, request: Request, db: Session = Depends(get_db)):
+@app.get("/admin/feedback/{feedback_id:int}")
+async def get_feedback_detail(feedback_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Get individual feedback details for modal"""
     # Check if user is admin
     from app.routers.auth import get_current_admin
-    current_admin = get_current_admin(request, db)
+    current_admin = await get_current_admin(request, db)
     
     if not current_admin:
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     # Get feedback by ID
     from app.models import Feedback
-    feedback = db.query(Feedback).filter(Feedback.id == feedback_id).first()
+    feedback = await db.scalar(select(Feedback).where(Feedback.id == feedback_id))
     
     if not feedback:
         raise HTTPException(status_code=404, detail="Feedback not found")
@@ -233,60 +344,60 @@ async def get_feedback_detail(feedback_id: int, request: Request, db: Session =
         "created_at": feedback.created_at.isoformat() if feedback.created_at else None
     }
 
-@app.delete("/admin/feedback/{feedback_id}")
-async def delete_feedback(feedback_id: int, request: Request, db: Session = Depends(get_db)):
+@app.delete("/admin/feedback/{feedback_id:int}")
+async def delete_feedback(feedback_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Delete feedback by ID"""
     
     # Check if user is admin
     from app.routers.auth import get_current_admin
-    current_admin = get_current_admin(request, db)
+    current_admin = await get_current_admin(request, db)
     
     if not current_admin:
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     # Get feedback by ID
     from app.models import Feedback
-    feedback = db.query(Feedback).filter(Feedback.id == feedback_id).first()
+    feedback = await db.scalar(select(Feedback).where(Feedback.id == feedback_id))
     
     if not feedback:
         raise HTTPException(status_code=404, detail="Feedback not found")
     
     try:
         # Delete the feedback
-        db.delete(feedback)
-        db.commit()
+        await db.delete(feedback)
+        await db.commit()
         
         return {"success": True, "message": "Feedback deleted successfully"}
         
     except Exception as e:
-        db.rollback()
-        print(f"Error deleting feedback: {e}")
+        await db.rollback()
+        logger.error("Error deleting feedback: %s", e)
         raise HTTPException(status_code=500, detail="Failed to delete feedback")
 
 @app.delete("/admin/feedback/clear-old")
-async def clear_old_feedback(request: Request, db: Session = Depends(get_db)):
+async def clear_old_feedback(request: Request, db: AsyncSession = Depends(get_db)):
     """Clear feedback older than 30 days"""
     
     # Check if user is admin
     from app.routers.auth import get_current_admin
-    current_admin = get_current_admin(request, db)
+    current_admin = await get_current_admin(request, db)
     
     if not current_admin:
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     try:
-        from datetime import datetime, timedelta
         from app.models import Feedback
         
         # Calculate date 30 days ago
         thirty_days_ago = datetime.now() - timedelta(days=30)
         
         # Delete old feedback
-        deleted_count = db.query(Feedback).filter(
-            Feedback.created_at < thirty_days_ago
-        ).delete()
+        result = await db.execute(
+            delete(Feedback).where(Feedback.created_at < thirty_days_ago)
+        )
+        deleted_count = result.rowcount
         
-        db.commit()
+        await db.commit()
         
         return {
             "success": True, 
@@ -295,58 +406,44 @@ async def clear_old_feedback(request: Request, db: Session = Depends(get_db)):
         }
         
     except Exception as e:
-        db.rollback()
-        print(f"Error clearing old feedback: {e}")
+        await db.rollback()
+        logger.error("Error clearing old feedback: %s", e)
         raise HTTPException(status_code=500, detail="Failed to clear old feedback")
 
 @app.get("/about", response_class=HTMLResponse)
 async def about_page(request: Request):
     """About Us page with company information"""
-    return templates.TemplateResponse("about.html", {
-        "request": request
-    })
+    return marketing_pages.response(request, "about.html")
 
 @app.get("/shipping", response_class=HTMLResponse)
 async def shipping_page(request: Request):
     """Shipping information page"""
-    return templates.TemplateResponse("shipping.html", {
-        "request": request
-    })
+    return marketing_pages.response(request, "shipping.html")
 
 @app.get("/returns", response_class=HTMLResponse)
 async def returns_page(request: Request):
     """Returns and exchange policy page"""
-    return templates.TemplateResponse("returns.html", {
-        "request": request
-    })
+    return marketing_pages.response(request, "returns.html")
 
 @app.get("/faq", response_class=HTMLResponse)
 async def faq_page(request: Request):
     """Frequently asked questions page"""
-    return templates.TemplateResponse("faq.html", {
-        "request": request
-    })
+    return marketing_pages.response(request, "faq.html")
 
 @app.get("/privacy", response_class=HTMLResponse)
 async def privacy_page(request: Request):
     """Privacy policy page"""
-    return templates.TemplateResponse("privacy.html", {
-        "request": request
-    })
+    return marketing_pages.response(request, "privacy.html")
 
 @app.get("/terms", response_class=HTMLResponse)
 async def terms_page(request: Request):
     """Terms of service page"""
-    return templates.TemplateResponse("terms.html", {
-        "request": request
-    })
+    return marketing_pages.response(request, "terms.html")
 
 @app.get("/cookies", response_class=HTMLResponse)
 async def cookies_page(request: Request):
     """Cookie policy page"""
-    return templates.TemplateResponse("cookies.html", {
-        "request": request
-    })
+    return marketing_pages.response(request, "cookies.html")
 
 # Debug/test routes removed for production
 
@@ -0,0 +1,236 @@
+"""Prometheus metrics for ``GET /metrics`` (text exposition format 0.0.4).
+
+``MetricsMiddleware`` times every HTTP request and files it under its route
+template (``/products/{product_id}``), method and status code, so label
+cardinality is bounded by the routes the app defines. Each (route, method)
+owns a ``RouteMetrics`` with fixed, non-cumulative bucket counts; recording a
+request is two dict lookups, a bisect and a few integer increments. Middleware
+only runs on the event loop thread, so there is a single writer and no lock.
+
+Everything else (DB pool, bcrypt pool, image worker, search counter,
+feedback queue, scheduler) is read when ``/metrics`` is scraped, so it costs
+nothing per request.
+
+Values are per worker process: with several uvicorn workers each scrape sees
+the worker that served it. Set ``METRICS_TOKEN`` to require
+``Authorization: Bearer <token>``.
+"""
+import os
+import time
+from bisect import bisect_left
+from typing import Dict, List
+
+from app import database
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "jbh_"
+
+# Upper bounds in seconds; one more bucket catches everything slower (+Inf)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED = "unmatched"
+
+
+class RouteMetrics:
+    """Latency histogram and status counts of one route and method"""
+
+    __slots__ = ("buckets", "count", "total", "statuses")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.statuses: Dict[int, int] = {}
+
+    def observe(self, seconds: float, status: int) -> None:
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+class RequestMetrics:
+    """RouteMetrics keyed by route template (or mount path), then method"""
+
+    def __init__(self):
+        self._routes: Dict[str, Dict[str, RouteMetrics]] = {}
+        self.started = time.time()
+
+    def observe(self, route: str, method: str, seconds: float, status: int) -> None:
+        methods = self._routes.get(route)
+        if methods is None:
+            methods = self._routes[route] = {}
+        metrics = methods.get(method)
+        if metrics is None:
+            metrics = methods[method] = RouteMetrics()
+        metrics.observe(seconds, status)
+
+    def items(self):
+        for route, methods in list(self._routes.items()):
+            for method, metrics in list(methods.items()):
+                yield route, method, metrics
+
+
+request_metrics = RequestMetrics()
+
+
+def _route_label(scope) -> str:
+    """Template of the matched route, or the mount path for mounted apps like /static"""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    root_path = scope.get("root_path", "")
+    if root_path != scope.get("app_root_path", ""):
+        return root_path
+    return UNMATCHED
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware feeding ``request_metrics``; add it outermost to see final status codes"""
+
+    def __init__(self, app, registry: RequestMetrics = request_metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.registry.observe(_route_label(scope), scope["method"], time.perf_counter() - started, status)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class _Writer:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def family(self, name: str, kind: str, help_text: str) -> None:
+        self.lines.append(f"# HELP {PREFIX}{name} {help_text}")
+        self.lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+    def sample(self, name: str, value, **labels) -> None:
+        self.lines.append(f"{PREFIX}{name}{_labels(**labels)} {value}")
+
+    def metric(self, name: str, kind: str, help_text: str, value, **labels) -> None:
+        self.family(name, kind, help_text)
+        self.sample(name, value, **labels)
+
+
+def _write_requests(out: _Writer, registry: RequestMetrics) -> None:
+    rows = sorted(registry.items(), key=lambda row: (row[0], row[1]))
+    out.family("http_request_duration_seconds", "histogram", "HTTP request latency by route template")
+    for route, method, metrics in rows:
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, metrics.buckets):
+            cumulative += count
+            out.sample("http_request_duration_seconds_bucket", cumulative, route=route, method=method, le=bound)
+        out.sample("http_request_duration_seconds_bucket", metrics.count, route=route, method=method, le="+Inf")
+        out.sample("http_request_duration_seconds_sum", round(metrics.total, 6), route=route, method=method)
+        out.sample("http_request_duration_seconds_count", metrics.count, route=route, method=method)
+    out.family("http_requests_total", "counter", "HTTP responses by route template and status code")
+    for route, method, metrics in rows:
+        for code, count in sorted(metrics.statuses.items()):
+            out.sample("http_requests_total", count, route=route, method=method, status=code)
+
+
+def _write_db_pools(out: _Writer) -> None:
+    pools = []
+    if database.engine is not None:
+        pools.append(("sync", database.engine.pool))
+    if database.async_engine is not None:
+        pools.append(("async", database.async_engine.sync_engine.pool))
+    # SQLite file databases use pools without checkout accounting
+    pools = [(name, pool) for name, pool in pools if hasattr(pool, "checkedout")]
+    if not pools:
+        return
+    gauges = [
+        ("db_pool_size", "Connections the pool keeps open", "size"),
+        ("db_pool_checked_out", "Connections currently checked out", "checkedout"),
+        ("db_pool_checked_in", "Idle connections in the pool", "checkedin"),
+        ("db_pool_overflow", "Connections open beyond the pool size (negative: unused capacity)", "overflow"),
+    ]
+    for name, help_text, method in gauges:
+        out.family(name, "gauge", help_text)
+        for engine_name, pool in pools:
+            out.sample(name, getattr(pool, method)(), engine=engine_name)
+
+
+def _write_workers(out: _Writer) -> None:
+    from app.analytics import search_counter
+    from app.feedback_queue import feedback_queue
+    from app.images import derivative_worker
+    from app.password_pool import password_pool
+
+    out.metric("password_pool_in_flight", "gauge", "bcrypt jobs running or waiting", password_pool.in_flight)
+    out.metric("password_pool_queue_depth", "gauge", "bcrypt jobs waiting for a worker", password_pool.queue_depth)
+    out.metric("password_pool_completed_total", "counter", "bcrypt jobs finished", password_pool.completed)
+    out.metric("password_pool_rejected_total", "counter", "bcrypt jobs refused with 503", password_pool.rejected)
+
+    out.metric("image_derivative_queue_depth", "gauge", "Image derivatives being rendered",
+               derivative_worker.queue_depth)
+
+    out.metric("searches_total", "counter", "Catalog searches recorded", search_counter.searches)
+    out.metric("search_stats_pending_products", "gauge", "Products with search counts not yet flushed",
+               len(search_counter.pending()))
+    out.metric("search_stats_flushed_products_total", "counter", "Product search counts written to the rollups",
+               search_counter.flushed)
+    out.metric("search_stats_flush_failures_total", "counter", "Failed search count flushes",
+               search_counter.flush_failures)
+
+    feedback = feedback_queue.stats()
+    out.metric("feedback_queue_depth", "gauge", "Contact messages spooled but not yet written", feedback["depth"])
+    out.metric("feedback_submitted_total", "counter", "Contact messages queued", feedback["submitted"])
+    out.metric("feedback_flushed_total", "counter", "Queued contact messages written", feedback["flushed"])
+    out.metric("feedback_written_directly_total", "counter", "Contact messages written synchronously",
+               feedback["written_directly"])
+    out.metric("feedback_dead_lettered_total", "counter", "Queued contact messages the database refused",
+               feedback["dead_lettered"])
+
+
+def _write_scheduler(out: _Writer) -> None:
+    from app.scheduler import scheduler
+
+    stats = scheduler.stats()
+    out.metric("scheduler_leader", "gauge", "1 if this worker runs scheduled jobs", int(stats["leader"]))
+    jobs = sorted(stats["jobs"].items())
+    for name, key, kind, help_text in (
+        ("scheduler_job_runs_total", "runs", "counter", "Scheduled job runs"),
+        ("scheduler_job_failures_total", "failures", "counter", "Scheduled job runs that raised"),
+        ("scheduler_job_rows_total", "rows", "counter", "Rows handled by scheduled jobs"),
+        ("scheduler_job_last_duration_seconds", "last_duration_seconds", "gauge", "Duration of the last run"),
+    ):
+        out.family(name, kind, help_text)
+        for job, job_stats in jobs:
+            out.sample(name, job_stats[key], job=job)
+
+
+def render(registry: RequestMetrics = request_metrics) -> str:
+    out = _Writer()
+    out.metric("process_start_time_seconds", "gauge", "Start time of this worker (unix seconds)", registry.started)
+    _write_requests(out, registry)
+    _write_db_pools(out)
+    _write_workers(out)
+    _write_scheduler(out)
+    return "\n".join(out.lines) + "\n"
@@ -1,7 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, Date, DateTime, Boolean, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from app.database import Base
-import json
 from datetime import datetime
 
 class Admin(Base):
@@ -27,6 +26,11 @@ class User(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Catalog and dashboard filters, keyset-paginated by id
+        Index("ix_products_category_id", "category", "id"),
+        Index("ix_products_status_id", "status", "id"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(100), nullable=False)
@@ -35,47 +39,84 @@ class Product(Base):
     category = Column(String(50), nullable=False)
     status = Column(String(20), default="Available", nullable=False)  # Available or Out of Stock
     image_url = Column(String(255), nullable=True)
-    images = Column(Text, nullable=True)  # JSON array of uploaded image paths
-    sizes = Column(Text, nullable=True)  # JSON array of available sizes
+    gender = Column(String(10), nullable=True, index=True)  # Male or Female
     
     # Relationships
     favourited_by = relationship("UserFavourite", back_populates="product")
+    # Uploaded images and available sizes; selectin-loaded with every product query
+    images = relationship(
+        "ProductImage", back_populates="product", order_by="ProductImage.position",
+        cascade="all, delete-orphan", passive_deletes=True, lazy="selectin"
+    )
+    sizes = relationship(
+        "ProductSize", back_populates="product", order_by="ProductSize.id",
+        cascade="all, delete-orphan", passive_deletes=True, lazy="selectin"
+    )
     
     def get_images_list(self):
         """Get uploaded images as a list, excluding the main image_url to avoid duplication"""
-        images = []
-        
-        # Only return uploaded images from the images field
-        if self.images:
-            try:
-                uploaded_images = json.loads(self.images)
-                if isinstance(uploaded_images, list):
-                    images.extend(uploaded_images)
-            except (json.JSONDecodeError, TypeError):
-                pass
-            
-        return images
+        return [image.path for image in self.images]
     
     def get_sizes_list(self):
         """Get available sizes as a list"""
-        sizes = []
-        
-        if self.sizes:
-            try:
-                sizes_data = json.loads(self.sizes)
-                if isinstance(sizes_data, list):
-                    sizes.extend(sizes_data)
-            except (json.JSONDecodeError, TypeError):
-                pass
-            
-        return sizes
+        return [size.size for size in self.sizes]
     
     def has_size(self, size):
         """Check if a specific size is available"""
         return size in self.get_sizes_list()
+    
+    def set_images(self, paths):
+        """Replace uploaded images, keeping rows for paths that stay"""
+        existing = {image.path: image for image in self.images}
+        images = []
+        for position, path in enumerate(dict.fromkeys(paths)):
+            image = existing.get(path) or ProductImage(path=path)
+            image.position = position
+            images.append(image)
+        self.images = images
+    
+    def set_sizes(self, sizes):
+        """Replace available sizes, keeping rows for sizes that stay"""
+        existing = {size.size: size for size in self.sizes}
+        self.sizes = [existing.get(size) or ProductSize(size=size) for size in dict.fromkeys(sizes)]
+
+class ProductImage(Base):
+    __tablename__ = "product_images"
+    __table_args__ = (
+        Index("ix_product_images_product_id_position", "product_id", "position"),
+        # "Is this upload still used?" before deleting a file
+        Index("ix_product_images_path", "path"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    path = Column(String(255), nullable=False)
+    position = Column(Integer, default=0, nullable=False)
+    
+    product = relationship("Product", back_populates="images")
+
+class ProductSize(Base):
+    __tablename__ = "product_sizes"
+    __table_args__ = (
+        UniqueConstraint("product_id", "size", name="uq_product_sizes_product_id_size"),
+        # Serves the catalog size filter: WHERE size = ? -> product ids
+        Index("ix_product_sizes_size_product_id", "size", "product_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    size = Column(String(20), nullable=False)
+    
+    product = relationship("Product", back_populates="sizes")
 
 class UserFavourite(Base):
     __tablename__ = "user_favourites"
+    __table_args__ = (
+        # One row per pair; also serves "favourites of user X" lookups
+        Index("uq_user_favourites_user_id_product_id", "user_id", "product_id", unique=True),
+        # Deleting a product's favourites
+        Index("ix_user_favourites_product_id", "product_id"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -99,11 +140,45 @@ class Session(Base):
     expires_at = Column(DateTime, nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
 
+# Session lookups go through the unique session_id; these serve the purge job
+Index("ix_sessions_expires_at", Session.expires_at)
+Index("ix_sessions_inactive", Session.id,
+      postgresql_where=Session.is_active.is_(False), sqlite_where=Session.is_active.is_(False))
+
 class Feedback(Base):
     __tablename__ = "feedback"
+    __table_args__ = (
+        # Inbox pages newest-first by (created_at, id); also the retention purge
+        Index("ix_feedback_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(100), nullable=False)
     email = Column(String(100), nullable=False)
     message = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.now, nullable=False)
+
+class ProductStat(Base):
+    """Per-product search and favourite totals, maintained incrementally by app.analytics"""
+    __tablename__ = "product_stats"
+    __table_args__ = (
+        # Top-N by searches (then favourites) is an index scan
+        Index("ix_product_stats_ranking", "search_count", "favourite_count"),
+    )
+    
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    search_count = Column(Integer, default=0, nullable=False)
+    favourite_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, nullable=False)
+
+class ProductStatDaily(Base):
+    """Per-product, per-day searches and favourites added, for trend charts"""
+    __tablename__ = "product_stats_daily"
+    __table_args__ = (
+        Index("ix_product_stats_daily_day", "day"),
+    )
+    
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    searches = Column(Integer, default=0, nullable=False)
+    favourites = Column(Integer, default=0, nullable=False)
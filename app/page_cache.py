@@ -0,0 +1,124 @@
+"""Pre-rendered marketing pages.
+
+The home, about, policy and size guide pages render the same HTML for every
+visitor: the header's login state is filled in client-side by the session
+manager. ``PageCache`` renders each page once at startup, compresses it once
+per supported Content-Encoding, and serves the stored bytes with an ETag and
+Last-Modified so a revisit is answered with 304.
+
+With ``RELOAD=true`` (development) every request checks the modification
+times of the templates and static assets, and re-renders all pages after a
+change; otherwise pages are rendered once per process.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterable, Optional
+
+from fastapi import Request
+from fastapi.templating import Jinja2Templates
+from starlette.responses import Response
+
+from app.static_assets import AVAILABLE_ENCODINGS, STATIC_DIR, UPLOAD_DIRS, accepted_encodings, compress
+
+logger = logging.getLogger(__name__)
+
+RELOAD = os.getenv("RELOAD", "false").lower() == "true"
+PAGE_CACHE_CONTROL = "no-cache"
+
+
+class CachedPage:
+    """One rendered page with its compressed variants"""
+
+    def __init__(self, html: str):
+        self.body = html.encode("utf-8")
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.rendered_at = time.time()
+        self.last_modified = formatdate(self.rendered_at, usegmt=True)
+        self.encoded: Dict[str, bytes] = {e: compress(self.body, e) for e in AVAILABLE_ENCODINGS}
+
+
+def _not_modified(request: Request, etag: str, page: CachedPage) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in tags or "*" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since).timestamp() >= int(page.rendered_at)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class PageCache:
+    """Rendered HTML of templates that take no context, served as stored bytes"""
+
+    def __init__(self, templates: Jinja2Templates, names: Iterable[str], reload: bool = RELOAD):
+        self.templates = templates
+        self.names = list(names)
+        self.reload = reload
+        self._lock = threading.Lock()
+        self._pages: Dict[str, CachedPage] = {}
+        self._source_mtime: Optional[float] = None
+
+    def _sources_mtime(self) -> float:
+        """Newest modification time among templates and static assets"""
+        newest = 0.0
+        for directory in list(self.templates.env.loader.searchpath) + [STATIC_DIR]:
+            for root, dirs, files in os.walk(directory):
+                if root == STATIC_DIR:
+                    dirs[:] = [d for d in dirs if d not in UPLOAD_DIRS]
+                for name in files:
+                    try:
+                        newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+                    except OSError:
+                        pass
+        return newest
+
+    def prerender(self) -> None:
+        """Render every page; called at startup"""
+        pages = {name: CachedPage(self.templates.get_template(name).render()) for name in self.names}
+        with self._lock:
+            self._pages = pages
+            if self.reload:
+                self._source_mtime = self._sources_mtime()
+        logger.info("Pre-rendered %s pages", len(pages))
+
+    def page(self, name: str) -> CachedPage:
+        if self.reload:
+            mtime = self._sources_mtime()
+            if mtime != self._source_mtime:
+                logger.debug("Templates changed, re-rendering cached pages")
+                with self._lock:
+                    self._pages = {}
+                    self._source_mtime = mtime
+        page = self._pages.get(name)
+        if page is None:
+            page = CachedPage(self.templates.get_template(name).render())
+            with self._lock:
+                self._pages[name] = page
+        return page
+
+    def response(self, request: Request, name: str) -> Response:
+        """The cached page, compressed if the client accepts it, or 304"""
+        page = self.page(name)
+        accepted = accepted_encodings(request.headers)
+        encoding = next((e for e in AVAILABLE_ENCODINGS if e in accepted), None)
+        etag = f'"{page.etag}-{encoding}"' if encoding else f'"{page.etag}"'
+        headers = {
+            "ETag": etag,
+            "Last-Modified": page.last_modified,
+            "Cache-Control": PAGE_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+        if _not_modified(request, etag, page):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return Response(page.encoded[encoding], media_type="text/html", headers=headers)
+        return Response(page.body, media_type="text/html", headers=headers)
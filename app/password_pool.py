@@ -0,0 +1,69 @@
+"""Bounded worker pool for bcrypt hashing and verification.
+
+A bcrypt round costs ~200ms of CPU. Running it inside an ``async def`` handler
+stalls every other request on the worker, so login and signup hand it to a
+small thread pool instead (the bcrypt C extension releases the GIL). At most
+``PASSWORD_POOL_WORKERS`` hashes run at once and ``PASSWORD_POOL_MAX_QUEUE``
+more may wait; beyond that ``PasswordPoolBusy`` is raised and the handler
+answers 503 so a login storm cannot grow an unbounded backlog.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_POOL_MAX_QUEUE = int(os.getenv("PASSWORD_POOL_MAX_QUEUE", "32"))
+# Seconds clients are asked to wait when the pool is saturated
+PASSWORD_POOL_RETRY_AFTER = 2
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the pool already has its maximum number of pending jobs"""
+
+
+class PasswordPool:
+    def __init__(self, workers: int = PASSWORD_POOL_WORKERS, max_queue: int = PASSWORD_POOL_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs accepted but still waiting for a free worker"""
+        return max(0, self._in_flight - self.workers)
+
+    async def run(self, fn: Callable, *args):
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PasswordPoolBusy()
+            self._in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self.completed += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+password_pool = PasswordPool()
@@ -0,0 +1,84 @@
+"""Rendered page cache.
+
+Product detail pages are rendered once and then served from memory. Each
+entry belongs to a group (the product's category, since a detail page also
+lists related products from that category). The admin product handlers call
+``invalidate`` with the categories they touched, which drops every page that
+could show the changed product.
+
+Entries also expire after ``DETAIL_CACHE_TTL_SECONDS``. With several uvicorn
+workers an admin edit only invalidates the worker that handled it, so the
+others may serve the old page for up to one TTL.
+
+``dashboard_stats_cache`` reuses the same structure for the admin
+dashboard's product counts; any product write clears it. Like the detail
+pages, that only clears the worker that handled the write: the dashboards of
+other workers can show the old counts (after a status change or delete) for
+up to ``DASHBOARD_STATS_TTL_SECONDS``.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+DETAIL_CACHE_TTL_SECONDS = int(os.getenv("DETAIL_CACHE_TTL_SECONDS", "60"))
+DETAIL_CACHE_MAX_ENTRIES = int(os.getenv("DETAIL_CACHE_MAX_ENTRIES", "2000"))
+# Also how long other workers' dashboards may lag behind a product write
+DASHBOARD_STATS_TTL_SECONDS = int(os.getenv("DASHBOARD_STATS_TTL_SECONDS", "30"))
+
+
+class RenderCache:
+    """Thread-safe TTL + LRU map of rendered HTML (or other computed values), invalidated by group"""
+
+    def __init__(self, max_entries: int = DETAIL_CACHE_MAX_ENTRIES, ttl: int = DETAIL_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """Bumped by every invalidation; pass it to ``set`` to drop renders that raced one"""
+        return self._generation
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            deadline, _, html = entry
+            if deadline < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return html
+
+    def set(self, key: Hashable, html: str, group: Hashable, generation: Optional[int] = None) -> None:
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, group, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *groups: Hashable) -> None:
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, (_, group, _) in self._entries.items() if group in groups]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+detail_cache = RenderCache()
+dashboard_stats_cache = RenderCache(max_entries=256, ttl=DASHBOARD_STATS_TTL_SECONDS)
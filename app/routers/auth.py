@@ -1,15 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Form, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Form, Query, status
 from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from passlib.context import CryptContext
+from app.templating import templates
 from app.database import get_db
 from app.models import Admin, User, UserFavourite, Product, Session
+from app.analytics import bump_stats
+from app.session_cache import CachedSession, session_cache
+from app.password_pool import PasswordPoolBusy, password_pool, PASSWORD_POOL_RETRY_AFTER
+from app.sql_profiler import query_budget
+import logging
+import os
 import secrets
 from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
-templates = Jinja2Templates(directory="templates")
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -17,6 +27,11 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # Session configuration
 SESSION_DURATION_DAYS = 7
 SESSION_DURATION_SECONDS = SESSION_DURATION_DAYS * 24 * 60 * 60
+# Minimum time between sliding-expiry writes for one session
+SESSION_REFRESH_INTERVAL_SECONDS = int(os.getenv("SESSION_REFRESH_INTERVAL_SECONDS", "300"))
+
+# Upper bound on product IDs accepted by the bulk favourite-status endpoint
+MAX_FAVOURITE_STATUS_IDS = 200
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -24,7 +39,25 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def create_session(username, user_type="admin", user_id=None, db=None):
+async def verify_password_async(plain_password, hashed_password):
+    """verify_password on the bcrypt worker pool; raises PasswordPoolBusy when saturated"""
+    return await password_pool.run(pwd_context.verify, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """get_password_hash on the bcrypt worker pool; raises PasswordPoolBusy when saturated"""
+    return await password_pool.run(pwd_context.hash, password)
+
+def _busy_response(template_name, context):
+    """503 page returned when the password pool is saturated"""
+    context["error"] = "We're handling a lot of sign-ins right now. Please try again in a moment."
+    return templates.TemplateResponse(
+        template_name,
+        context,
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(PASSWORD_POOL_RETRY_AFTER)}
+    )
+
+async def create_session(username, user_type="admin", user_id=None, db=None):
     """Create a new session in the database"""
     session_id = secrets.token_urlsafe(32)
     expiry = datetime.now() + timedelta(days=SESSION_DURATION_DAYS)
@@ -41,8 +74,8 @@ def create_session(username, user_type="admin", user_id=None, db=None):
     
     if db:
         db.add(new_session)
-        db.commit()
-        db.refresh(new_session)
+        await db.commit()
+        await db.refresh(new_session)
     
     return session_id
 
@@ -58,81 +91,102 @@ def is_session_valid(session_data):
     # Check if session has expired
     return datetime.now() < session_data.expires_at
 
-def get_current_admin(request: Request, db: Session = None):
-    session_id = request.cookies.get("session_id")
-    if not session_id or not db:
-        return None
-    
-    session_data = db.query(Session).filter(
+async def _lookup_session(session_id, user_type, db):
+    """Return a valid session of the given type, served from the session cache when possible"""
+    cached = await session_cache.get(session_id)
+    if cached is not None:
+        if cached.user_type != user_type:
+            return None
+        if is_session_valid(cached):
+            return cached
+        await session_cache.invalidate(session_id)
+    
+    session_data = await db.scalar(select(Session).where(
         Session.session_id == session_id,
-        Session.user_type == "admin",
+        Session.user_type == user_type,
         Session.is_active.is_(True)
-    ).first()
+    ))
     
     if not session_data or not is_session_valid(session_data):
         # Mark session as inactive if expired
         if session_data:
             session_data.is_active = False
-            db.commit()
+            await db.commit()
         return None
     
-    return session_data
+    cached = CachedSession.from_row(session_data)
+    await session_cache.set(cached)
+    return cached
 
-def get_current_user(request: Request, db: Session = None):
-    session_id = request.cookies.get("user_session_id")
+async def get_current_admin(request: Request, db: AsyncSession = None):
+    session_id = request.cookies.get("session_id")
     if not session_id or not db:
         return None
     
-    session_data = db.query(Session).filter(
-        Session.session_id == session_id,
-        Session.user_type == "user",
-        Session.is_active.is_(True)
-    ).first()
-    
-    if not session_data or not is_session_valid(session_data):
-        # Mark session as inactive if expired
-        if session_data:
-            session_data.is_active = False
-            db.commit()
+    return await _lookup_session(session_id, "admin", db)
+
+async def get_current_user(request: Request, db: AsyncSession = None):
+    session_id = request.cookies.get("user_session_id")
+    if not session_id or not db:
         return None
     
-    return session_data
+    return await _lookup_session(session_id, "user", db)
 
-def get_current_session(request: Request, db: Session = None):
+async def get_current_session(request: Request, db: AsyncSession = None):
     # Check for admin session first
-    admin_session = get_current_admin(request, db)
+    admin_session = await get_current_admin(request, db)
     if admin_session:
         return admin_session
     
     # Check for user session
-    user_session = get_current_user(request, db)
+    user_session = await get_current_user(request, db)
     if user_session:
         return user_session
     
     return None
 
-def refresh_session(session_id, user_type="admin", db=None):
-    """Refresh session expiry"""
+async def refresh_session(session_id, user_type="admin", db=None):
+    """Refresh session expiry.
+
+    The sliding expiry is written at most once per SESSION_REFRESH_INTERVAL_SECONDS
+    per session: until then the stored expiry is still recent enough and the
+    status poll costs no write.
+    """
     if not db:
         return None
     
-    session_data = db.query(Session).filter(
-        Session.session_id == session_id,
-        Session.user_type == user_type,
-        Session.is_active.is_(True)
-    ).first()
+    session_data = await _lookup_session(session_id, user_type, db)
+    if not session_data:
+        return None
     
-    if session_data:
-        session_data.expires_at = datetime.now() + timedelta(days=SESSION_DURATION_DAYS)
-        db.commit()
+    now = datetime.now()
+    new_expiry = now + timedelta(days=SESSION_DURATION_DAYS)
+    if new_expiry - session_data.expires_at < timedelta(seconds=SESSION_REFRESH_INTERVAL_SECONDS):
         return session_data
     
-    return None
+    result = await db.execute(
+        update(Session).where(
+            Session.session_id == session_id,
+            Session.user_type == user_type,
+            Session.is_active.is_(True)
+        ).values(expires_at=new_expiry)
+    )
+    await db.commit()
+    updated = result.rowcount
+    
+    if not updated:
+        # Logged out elsewhere since it was cached
+        await session_cache.invalidate(session_id)
+        return None
+    
+    session_data.expires_at = new_expiry
+    await session_cache.set(session_data)
+    return session_data
 
 @router.get("/session/status")
-async def get_session_status(request: Request, db: Session = Depends(get_db)):
+async def get_session_status(request: Request, db: AsyncSession = Depends(get_db)):
     """Get current session status for client-side validation"""
-    current_session = get_current_session(request, db)
+    current_session = await get_current_session(request, db)
     
     if current_session:
         # Refresh session if valid
@@ -143,12 +197,12 @@ async def get_session_status(request: Request, db: Session = Depends(get_db)):
             session_id = request.cookies.get("user_session_id")
         
         if session_id:
-            refresh_session(session_id, current_session.user_type, db)
+            await refresh_session(session_id, current_session.user_type, db)
         
         # For regular users, get their actual name from the User model
         display_name = current_session.username
         if current_session.user_type == "user":
-            user = db.query(User).filter(User.id == current_session.user_id).first()
+            user = await db.scalar(select(User).where(User.id == current_session.user_id))
             if user and user.name:
                 display_name = user.name
             elif user:
@@ -169,9 +223,9 @@ async def get_session_status(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.get("/login", response_class=HTMLResponse)
-async def login_page(request: Request, db: Session = Depends(get_db)):
+async def login_page(request: Request, db: AsyncSession = Depends(get_db)):
     # Check if admin is already logged in
-    current_session = get_current_admin(request, db)
+    current_session = await get_current_admin(request, db)
     if current_session:
         # Admin is already logged in, redirect to dashboard
         return RedirectResponse(url="/products/admin/dashboard", status_code=status.HTTP_302_FOUND)
@@ -180,9 +234,9 @@ async def login_page(request: Request, db: Session = Depends(get_db)):
     return templates.TemplateResponse("admin_login.html", {"request": request})
 
 @router.get("/user/login", response_class=HTMLResponse)
-async def user_login_page(request: Request, db: Session = Depends(get_db)):
+async def user_login_page(request: Request, db: AsyncSession = Depends(get_db)):
     # Check if user is already logged in
-    current_session = get_current_user(request, db)
+    current_session = await get_current_user(request, db)
     if current_session:
         # User is already logged in, redirect to home page
         return RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
@@ -201,18 +255,24 @@ async def user_login_page(request: Request, db: Session = Depends(get_db)):
     return templates.TemplateResponse("user_login.html", context)
 
 @router.post("/user/login")
+@query_budget(3)
 async def user_login(
     request: Request,
     email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Validate user credentials against database
-    user = db.query(User).filter(User.email == email).first()
+    user = await db.scalar(select(User).where(User.email == email))
+    
+    try:
+        password_ok = bool(user) and await verify_password_async(password, user.password)
+    except PasswordPoolBusy:
+        return _busy_response("user_login.html", {"request": request, "prefill_email": email})
     
-    if user and pwd_context.verify(password, user.password):
+    if password_ok:
         # Create user session with user ID in database
-        session_id = create_session(email, "user", user.id, db)
+        session_id = await create_session(email, "user", user.id, db)
         
         # Redirect to home page with session cookie
         response = RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
@@ -244,7 +304,7 @@ async def user_signup(
     password: str = Form(...),
     confirm_password: str = Form(...),
     whatsapp: str = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Validate passwords match
     if password != confirm_password:
@@ -255,7 +315,7 @@ async def user_signup(
         )
     
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == email).first()
+    existing_user = await db.scalar(select(User).where(User.email == email))
     if existing_user:
         return templates.TemplateResponse(
             "user_signup.html", 
@@ -264,7 +324,13 @@ async def user_signup(
         )
     
     # Create new user
-    hashed_password = pwd_context.hash(password)
+    try:
+        hashed_password = await get_password_hash_async(password)
+    except PasswordPoolBusy:
+        return _busy_response(
+            "user_signup.html",
+            {"request": request, "prefillEmail": email, "prefillName": name, "prefillWhatsapp": whatsapp}
+        )
     
     new_user = User(
         name=name,
@@ -277,15 +343,15 @@ async def user_signup(
     
     try:
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
         
         # Redirect to login page with pre-filled data
         response = RedirectResponse(url="/auth/user/login?signup=success&email=" + email, status_code=status.HTTP_302_FOUND)
         return response
     except Exception as e:
-        db.rollback()
-        print(f"Error creating user: {e}")  # Add debug logging
+        await db.rollback()
+        logger.error("Error creating user: %s", e)
         return templates.TemplateResponse(
             "user_signup.html", 
             {"request": request, "error": "Failed to create account. Please try again.", "prefillEmail": email, "prefillName": name, "prefillWhatsapp": whatsapp},
@@ -297,12 +363,17 @@ async def login(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Check if admin exists
-    admin = db.query(Admin).filter(Admin.username == username).first()
+    admin = await db.scalar(select(Admin).where(Admin.username == username))
+    
+    try:
+        password_ok = bool(admin) and await verify_password_async(password, admin.password)
+    except PasswordPoolBusy:
+        return _busy_response("admin_login.html", {"request": request})
     
-    if not admin or not verify_password(password, admin.password):
+    if not password_ok:
         return templates.TemplateResponse(
             "admin_login.html", 
             {"request": request, "error": "Invalid username or password"},
@@ -310,7 +381,7 @@ async def login(
         )
     
     # Create session in database
-    session_id = create_session(username, "admin", None, db)
+    session_id = await create_session(username, "admin", None, db)
     
     # Redirect to dashboard with session cookie
     response = RedirectResponse(url="/products/", status_code=status.HTTP_302_FOUND)
@@ -325,47 +396,69 @@ async def login(
     return response
 
 @router.get("/logout")
-async def logout(request: Request, db: Session = Depends(get_db)):
+async def logout(request: Request, db: AsyncSession = Depends(get_db)):
     session_id = request.cookies.get("session_id")
     if session_id:
+        await session_cache.invalidate(session_id)
         # Mark session as inactive in database
-        session_data = db.query(Session).filter(
+        session_data = await db.scalar(select(Session).where(
             Session.session_id == session_id,
             Session.user_type == "admin"
-        ).first()
+        ))
         if session_data:
             session_data.is_active = 0
-            db.commit()
+            await db.commit()
     
     response = RedirectResponse(url="/products/admin/dashboard", status_code=status.HTTP_302_FOUND)
     response.delete_cookie(key="session_id")
     return response
 
 @router.get("/user/logout")
-async def user_logout(request: Request, db: Session = Depends(get_db)):
+async def user_logout(request: Request, db: AsyncSession = Depends(get_db)):
     session_id = request.cookies.get("user_session_id")
     if session_id:
+        await session_cache.invalidate(session_id)
         # Mark session as inactive in database
-        session_data = db.query(Session).filter(
+        session_data = await db.scalar(select(Session).where(
             Session.session_id == session_id,
             Session.user_type == "user"
-        ).first()
+        ))
         if session_data:
             session_data.is_active = 0
-            db.commit()
+            await db.commit()
     
     response = RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
     response.delete_cookie(key="user_session_id")
     return response
 
+def _favourite_insert(dialect: str):
+    """INSERT into user_favourites supporting ON CONFLICT DO NOTHING, or None if the dialect lacks it"""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(UserFavourite)
+
+async def _favourite_products(db: AsyncSession, user_id: int):
+    """The user's favourited products, oldest favourite first; images load in one extra query"""
+    return (await db.scalars(
+        select(Product)
+        .join(UserFavourite, UserFavourite.product_id == Product.id)
+        .where(UserFavourite.user_id == user_id)
+        .order_by(UserFavourite.id)
+    )).all()
+
 @router.post("/user/favourites/add/{product_id}")
+@query_budget(4)
 async def add_to_favourites(
     product_id: int,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Add product to user's favourites"""
-    current_session = get_current_user(request, db)
+    current_session = await get_current_user(request, db)
     if not current_session:
         return {"success": False, "message": "User not logged in"}
     
@@ -373,38 +466,46 @@ async def add_to_favourites(
     if not user_id:
         return {"success": False, "message": "User not logged in"}
     
-    # Check if product exists
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
-        return {"success": False, "message": "Product not found"}
-    
-    # Check if already favourited
-    existing_fav = db.query(UserFavourite).filter(
-        UserFavourite.user_id == user_id,
-        UserFavourite.product_id == product_id
-    ).first()
-    
-    if existing_fav:
-        return {"success": False, "message": "Product already in favourites"}
-    
-    # Add to favourites
+    # Insert-if-absent in one statement; the SELECT skips products that do not exist
     try:
-        new_favourite = UserFavourite(user_id=user_id, product_id=product_id)
-        db.add(new_favourite)
-        db.commit()
-        return {"success": True, "message": "Added to favourites"}
+        source = select(literal(user_id), Product.id).where(Product.id == product_id)
+        stmt = _favourite_insert(db.bind.dialect.name)
+        if stmt is not None:
+            stmt = stmt.from_select(["user_id", "product_id"], source).on_conflict_do_nothing(
+                index_elements=["user_id", "product_id"]
+            )
+            inserted = (await db.execute(stmt)).rowcount
+        else:
+            # Other databases: plain insert, the unique index rejects duplicates
+            try:
+                inserted = (await db.execute(
+                    insert(UserFavourite).from_select(["user_id", "product_id"], source)
+                )).rowcount
+            except IntegrityError:
+                await db.rollback()
+                inserted = 0
+        if inserted:
+            await db.run_sync(bump_stats, favourites={product_id: 1})
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         return {"success": False, "message": "Failed to add to favourites"}
 
+    if inserted:
+        return {"success": True, "message": "Added to favourites"}
+    if await db.scalar(select(Product.id).where(Product.id == product_id)) is None:
+        return {"success": False, "message": "Product not found"}
+    return {"success": True, "message": "Product already in favourites"}
+
 @router.delete("/user/favourites/remove/{product_id}")
+@query_budget(4)
 async def remove_from_favourites(
     product_id: int,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Remove product from user's favourites"""
-    current_session = get_current_user(request, db)
+    current_session = await get_current_user(request, db)
     if not current_session:
         return {"success": False, "message": "User not logged in"}
     
@@ -414,29 +515,31 @@ async def remove_from_favourites(
     
     # Remove from favourites
     try:
-        favourite = db.query(UserFavourite).filter(
+        favourite = await db.scalar(select(UserFavourite).where(
             UserFavourite.user_id == user_id,
             UserFavourite.product_id == product_id
-        ).first()
+        ))
         
         if favourite:
-            db.delete(favourite)
-            db.commit()
+            await db.delete(favourite)
+            await db.run_sync(bump_stats, favourites={product_id: -1})
+            await db.commit()
             return {"success": True, "message": "Removed from favourites"}
         else:
             return {"success": False, "message": "Product not in favourites"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         return {"success": False, "message": "Failed to remove from favourites"}
 
 @router.get("/user/favourites/check/{product_id}")
+@query_budget(2)
 async def check_favourite_status(
     product_id: int,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Check if a product is favourited by the current user"""
-    current_session = get_current_user(request, db)
+    current_session = await get_current_user(request, db)
     if not current_session:
         return {"is_favourited": False, "message": "User not logged in"}
     
@@ -445,17 +548,43 @@ async def check_favourite_status(
         return {"is_favourited": False, "message": "User not logged in"}
     
     # Check if product is favourited
-    favourite = db.query(UserFavourite).filter(
+    favourite = await db.scalar(select(UserFavourite).where(
         UserFavourite.user_id == user_id,
         UserFavourite.product_id == product_id
-    ).first()
+    ))
     
     return {"is_favourited": favourite is not None}
 
+async def get_favourite_ids(request: Request, db: AsyncSession, product_ids: Optional[Iterable[int]] = None) -> Set[int]:
+    """Product IDs the logged-in user has favourited, optionally limited to ``product_ids``; one query"""
+    current_session = await get_current_user(request, db)
+    if not current_session or not current_session.user_id:
+        return set()
+
+    stmt = select(UserFavourite.product_id).where(UserFavourite.user_id == current_session.user_id)
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return set()
+        stmt = stmt.where(UserFavourite.product_id.in_(product_ids))
+    return set((await db.scalars(stmt)).all())
+
+@router.get("/user/favourites/status")
+@query_budget(2)
+async def bulk_favourite_status(
+    request: Request,
+    ids: Optional[List[int]] = Query(None, max_length=MAX_FAVOURITE_STATUS_IDS),
+    db: AsyncSession = Depends(get_db)
+):
+    """Which of ``ids`` (default: all products) the current user has favourited"""
+    favourite_ids = await get_favourite_ids(request, db, ids)
+    return {"favourited": sorted(favourite_ids)}
+
 @router.get("/user/profile", response_class=HTMLResponse)
-async def user_profile(request: Request, db: Session = Depends(get_db)):
+@query_budget(5)
+async def user_profile(request: Request, db: AsyncSession = Depends(get_db)):
     """User profile page with favourites"""
-    current_session = get_current_user(request, db)
+    current_session = await get_current_user(request, db)
     if not current_session:
         return RedirectResponse(url="/auth/user/login", status_code=status.HTTP_302_FOUND)
     
@@ -465,12 +594,11 @@ async def user_profile(request: Request, db: Session = Depends(get_db)):
         return RedirectResponse(url="/auth/user/login", status_code=status.HTTP_302_FOUND)
     
     # Get complete user data from database
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         return RedirectResponse(url="/auth/user/login", status_code=status.HTTP_302_FOUND)
     
-    favourites = db.query(UserFavourite).filter(UserFavourite.user_id == user_id).all()
-    favourite_products = [fav.product for fav in favourites]
+    favourite_products = await _favourite_products(db, user_id)
     
     return templates.TemplateResponse("user_profile.html", {
         "request": request,
@@ -487,9 +615,10 @@ async def user_profile(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.get("/user/favourites", response_class=HTMLResponse)
-async def user_favourites(request: Request, db: Session = Depends(get_db)):
+@query_budget(5)
+async def user_favourites(request: Request, db: AsyncSession = Depends(get_db)):
     """User favourites page"""
-    current_session = get_current_user(request, db)
+    current_session = await get_current_user(request, db)
     if not current_session:
         return RedirectResponse(url="/auth/user/login", status_code=status.HTTP_302_FOUND)
     
@@ -499,12 +628,11 @@ async def user_favourites(request: Request, db: Session = Depends(get_db)):
         return RedirectResponse(url="/auth/user/login", status_code=status.HTTP_302_FOUND)
     
     # Get complete user data from database
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         return RedirectResponse(url="/auth/user/login", status_code=status.HTTP_302_FOUND)
     
-    favourites = db.query(UserFavourite).filter(UserFavourite.user_id == user_id).all()
-    favourite_products = [fav.product for fav in favourites]
+    favourite_products = await _favourite_products(db, user_id)
     
     return templates.TemplateResponse("user_favourites.html", {
         "request": request,
@@ -521,14 +649,14 @@ async def user_favourites(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.get("/admin/users", response_class=HTMLResponse)
-async def admin_users(request: Request, db: Session = Depends(get_db)):
+async def admin_users(request: Request, db: AsyncSession = Depends(get_db)):
     """Admin users page - only accessible to admins"""
-    current_session = get_current_admin(request, db)
+    current_session = await get_current_admin(request, db)
     if not current_session:
         return RedirectResponse(url="/auth/login", status_code=status.HTTP_302_FOUND)
     
     # Get all users
-    users = db.query(User).all()
+    users = (await db.scalars(select(User))).all()
     
     return templates.TemplateResponse("admin_users.html", {
         "request": request,
@@ -544,10 +672,10 @@ async def update_user_profile(
     request: Request,
     name: str = Form(...),
     whatsapp: str = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update user profile information"""
-    current_session = get_current_user(request, db)
+    current_session = await get_current_user(request, db)
     if not current_session:
         return JSONResponse(
             {"success": False, "message": "User not authenticated"},
@@ -556,7 +684,7 @@ async def update_user_profile(
     
     try:
         # Update user in database
-        user = db.query(User).filter(User.id == current_session.user_id).first()
+        user = await db.scalar(select(User).where(User.id == current_session.user_id))
         if not user:
             return JSONResponse(
                 {"success": False, "message": "User not found"},
@@ -567,8 +695,8 @@ async def update_user_profile(
         user.whatsapp = whatsapp
         user.updated_at = datetime.now()
         
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
         
         return JSONResponse({
             "success": True,
@@ -582,8 +710,8 @@ async def update_user_profile(
         })
         
     except Exception as e:
-        db.rollback()
-        print(f"Error updating user profile: {e}")
+        await db.rollback()
+        logger.error("Error updating user profile: %s", e)
         return JSONResponse(
             {"success": False, "message": "Failed to update profile"},
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -1,193 +1,162 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Form, Query, status, UploadFile, File
-from fastapi.responses import RedirectResponse, HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
-from app.models import Product
-from app.routers.auth import get_current_admin, get_current_session
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+from app.models import Product, ProductSize, ProductStat, ProductStatDaily, UserFavourite
+from app.routers.auth import get_current_admin, get_current_session, get_favourite_ids
+from sqlalchemy import delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.templating import templates
 from app.database import get_db
+from app.search import search_products, index_product, remove_product
+from app.sql_profiler import query_budget
+from app.analytics import TREND_BUCKETS, search_counter, trend_buckets
+from app.render_cache import dashboard_stats_cache, detail_cache
+from app.images import generate_derivatives, remove_derivatives
+from app.uploads import UploadRejected, delete_upload_if_unused, max_upload_size_label, save_uploads
 from typing import Optional, List
+from starlette.concurrency import run_in_threadpool
+import logging
 import os
-import json
-import uuid
-from datetime import datetime
-from collections import defaultdict
+import re
+from datetime import date, datetime, timedelta
+from collections import Counter, defaultdict
 from sqlalchemy import func
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/products", tags=["Products"])
-templates = Jinja2Templates(directory="templates")
 
 # Product categories
 CATEGORIES = ["Sports", "Casual", "Formal", "Boots", "Sneakers", "Sandals/Slippers"]
 SIZES = ["6", "7", "8", "9", "10", "11", "12"]
 STATUSES = ["Available", "Out of Stock"]
+GENDERS = ["Male", "Female"]
+
+# Pagination (keyset on Product.id)
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "24"))
+DASHBOARD_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 100
+
+# Analytics page
+ANALYTICS_TOP_N = int(os.getenv("ANALYTICS_TOP_N", "50"))
+ANALYTICS_TREND_DAYS = 30
+
+def _products_changed(*categories: Optional[str]) -> None:
+    """Drop cached pages and dashboard counts after a product write"""
+    detail_cache.invalidate(*categories)
+    dashboard_stats_cache.clear()
+
+
+def _parse_sizes(values: List[str]) -> List[str]:
+    """Split submitted size fields ("7, 8 9") into individual sizes"""
+    return [size for value in values for size in re.split(r"[,\s]+", value) if size]
+
+async def _paginate(db: AsyncSession, stmt, after: Optional[int], limit: int):
+    """Keyset page of a Product select ordered by id; returns (products, next_cursor)"""
+    if after:
+        stmt = stmt.where(Product.id > after)
+    rows = (await db.scalars(stmt.order_by(Product.id).limit(limit + 1))).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def _paginate_ranked(products: List[Product], after: Optional[int], limit: int):
+    """Page through an already ranked list, using the last product id shown as cursor"""
+    start = 0
+    if after:
+        ids = [p.id for p in products]
+        start = ids.index(after) + 1 if after in ids else len(products)
+    page = products[start:start + limit]
+    next_cursor = page[-1].id if page and start + limit < len(products) else None
+    return page, next_cursor
+
+def _category_filter(category: str):
+    """Exact match for a known category (indexed); substring match for anything else"""
+    known = next((c for c in CATEGORIES if c.lower() == category.strip().lower()), None)
+    return Product.category == known if known else Product.category.ilike(f"%{category}%")
+
+async def _catalog_products(db: AsyncSession, search: Optional[str], category: Optional[str], status: Optional[str],
+                            size: Optional[str], gender: Optional[str], after: Optional[int], limit: int):
+    """Fetch one catalog page; returns (products, next_cursor)"""
+    # Build SQLAlchemy query
+    base_query = select(Product)
+
+    # Apply exact filters first
+    if category:
+        base_query = base_query.where(_category_filter(category))
+    if status:
+        base_query = base_query.where(Product.status == status)
+    if gender:
+        base_query = base_query.where(Product.gender == gender)
+    if size:
+        # Uses ix_product_sizes_size_product_id
+        base_query = base_query.where(
+            Product.id.in_(select(ProductSize.product_id).where(ProductSize.size == size))
+        )
 
-# Ensure uploads directory exists
-UPLOADS_DIR = "static/uploads"
-os.makedirs(UPLOADS_DIR, exist_ok=True)
-
-# Analytics file storage (for search counts)
-ANALYTICS_DIR = "analytics"
-SEARCH_STATS_FILE = os.path.join(ANALYTICS_DIR, "search_stats.json")
-GENDER_MAP_FILE = os.path.join(ANALYTICS_DIR, "gender_map.json")
-os.makedirs(ANALYTICS_DIR, exist_ok=True)
-
-def _load_search_stats() -> dict:
-    try:
-        if os.path.exists(SEARCH_STATS_FILE):
-            with open(SEARCH_STATS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"WARN: failed to load search stats: {e}")
-    return {}
-
-def _save_search_stats(stats: dict) -> None:
-    try:
-        with open(SEARCH_STATS_FILE, "w", encoding="utf-8") as f:
-            json.dump(stats, f)
-    except Exception as e:
-        print(f"WARN: failed to save search stats: {e}")
-
-def _increment_search_counts(product_ids: List[int]):
-    if not product_ids:
-        return
-    stats = _load_search_stats()
-    for pid in product_ids:
-        key = str(pid)
-        stats[key] = int(stats.get(key, 0)) + 1
-    _save_search_stats(stats)
-
-def _load_gender_map() -> dict:
-    try:
-        if os.path.exists(GENDER_MAP_FILE):
-            with open(GENDER_MAP_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"WARN: failed to load gender map: {e}")
-    return {}
+    if not (search and search.strip()):
+        # No search text: just list with filters
+        return await _paginate(db, base_query, after, limit)
+
+    # Ranked full-text search over name, description and category, paged by (rank, id)
+    page = await search_products(db, search.strip(), base_query, after, limit)
+    if page is not None and (page[0] or after):
+        products, next_cursor = page
+    # If nothing matched (or we are paging the fallback list), loosen to any product (closest related):
+    #    Prefer products in the same category if category was given, else recent ones
+    elif category:
+        products, next_cursor = await _paginate(
+            db, select(Product).where(_category_filter(category)), after, limit
+        )
+    else:
+        recent = (await db.scalars(select(Product).order_by(Product.id.desc()).limit(12))).all()
+        products, next_cursor = _paginate_ranked(recent, after, limit)
 
-def _save_gender_map(gmap: dict) -> None:
-    try:
-        with open(GENDER_MAP_FILE, "w", encoding="utf-8") as f:
-            json.dump(gmap, f)
-    except Exception as e:
-        print(f"WARN: failed to save gender map: {e}")
+    # Update analytics: count a search for products shown (buffered, flushed in batches)
+    search_counter.record(p.id for p in products)
 
-def save_uploaded_file(file: UploadFile) -> str:
-    """Save uploaded file and return the file path"""
-    try:
-        print(f"DEBUG: Starting file upload for: {file.filename}")
-        print(f"DEBUG: File content type: {file.content_type}")
-        print(f"DEBUG: File size: {file.size if hasattr(file, 'size') else 'Unknown'}")
-        
-        # Generate unique filename
-        file_extension = os.path.splitext(file.filename)[1] if file.filename else '.jpg'
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(UPLOADS_DIR, unique_filename)
-        
-        print(f"DEBUG: Generated filename: {unique_filename}")
-        print(f"DEBUG: Full file path: {file_path}")
-        print(f"DEBUG: Uploads directory exists: {os.path.exists(UPLOADS_DIR)}")
-        print(f"DEBUG: Uploads directory writable: {os.access(UPLOADS_DIR, os.W_OK)}")
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            content = file.file.read()
-            buffer.write(content)
-        
-        print(f"DEBUG: File saved successfully to: {file_path}")
-        print(f"DEBUG: File exists after save: {os.path.exists(file_path)}")
-        
-        return f"/static/uploads/{unique_filename}"
-    except Exception as e:
-        print(f"ERROR in save_uploaded_file: {e}")
-        import traceback
-        traceback.print_exc()
-        raise e
+    return products, next_cursor
 
 @router.get("/", response_class=HTMLResponse)
+@query_budget(7)
 async def catalog_page(
     request: Request,
     search: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
-    status: Optional[str] = Query(None)
-    , db: Session = Depends(get_db)
+    status: Optional[str] = Query(None),
+    size: Optional[str] = Query(None),
+    gender: Optional[str] = Query(None),
+    after: Optional[int] = Query(None, ge=0),
+    limit: int = Query(CATALOG_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    , db: AsyncSession = Depends(get_db)
 ):
     """Product catalog page with search and filters"""
     try:
-        from sqlalchemy import or_, and_
-        # Build SQLAlchemy query
-        base_query = db.query(Product)
-
-        # Apply exact filters first
-        if category:
-            base_query = base_query.filter(Product.category.ilike(f"%{category}%"))
-        if status:
-            base_query = base_query.filter(Product.status == status)
-
-        products = []
-
-        if search and search.strip():
-            # Case-insensitive, partial matching across name, description, and category
-            raw = search.strip()
-            tokens = [t for t in raw.replace("/", " ").replace("-", " ").split() if t]
-
-            # 1) Try full-string match across fields
-            full_cond = or_(
-                Product.name.ilike(f"%{raw}%"),
-                Product.description.ilike(f"%{raw}%"),
-                Product.category.ilike(f"%{raw}%")
-            )
-            query1 = base_query.filter(full_cond)
-            products = query1.order_by(Product.id).all()
-
-            # 2) If nothing, try token-wise OR across fields
-            if not products and tokens:
-                token_ors = []
-                for tok in tokens:
-                    token_ors.append(Product.name.ilike(f"%{tok}%"))
-                    token_ors.append(Product.description.ilike(f"%{tok}%"))
-                    token_ors.append(Product.category.ilike(f"%{tok}%"))
-                query2 = base_query.filter(or_(*token_ors))
-                products = query2.order_by(Product.id).all()
-
-            # 3) If still nothing, loosen to any product (closest related):
-            #    Prefer products in the same category if category was given, else recent ones
-            if not products:
-                if category:
-                    products = db.query(Product).filter(Product.category.ilike(f"%{category}%")).order_by(Product.id).all()
-                else:
-                    products = db.query(Product).order_by(Product.id.desc()).limit(12).all()
-
-            # Update analytics: increment search count for products shown for this search
-            try:
-                _increment_search_counts([p.id for p in products])
-            except Exception as e:
-                print(f"WARN: failed to increment search counts: {e}")
-        else:
-            # No search text: just list with filters
-            products = base_query.order_by(Product.id).all()
+        products, next_cursor = await _catalog_products(db, search, category, status, size, gender, after, limit)
         
-        # Debug: Print product information
-        print(f"DEBUG: Found {len(products)} products in catalog")
-        for p in products:
-            print(f"DEBUG: Product ID: {p.id}, Name: {p.name}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Catalog page: %s products %s", len(products), [p.id for p in products])
 
         # Unique categories for filter dropdown
-        categories = [row[0] for row in db.query(Product.category).distinct().all() if row[0]]
+        categories = [c for c in (await db.scalars(select(Product.category).distinct())).all() if c]
+        # Favourite state for the cards, so the page needs no per-product status requests
+        favourite_ids = await get_favourite_ids(request, db, [p.id for p in products])
         
         return templates.TemplateResponse("catalog.html", {
             "request": request,
             "products": products,
+            "favourite_ids": favourite_ids,
             "categories": categories,
             "current_search": search,
             "current_category": category,
-            "current_status": status
+            "current_status": status,
+            "current_size": size,
+            "current_gender": gender,
+            "next_cursor": next_cursor,
+            "page_size": limit
         })
         
     except Exception as e:
-        print(f"Error loading catalog: {e}")
+        logger.error("Error loading catalog: %s", e)
         return templates.TemplateResponse("catalog.html", {
             "request": request,
             "products": [],
@@ -195,42 +164,82 @@ async def catalog_page(
             "error": "Error loading products"
         })
 
+@router.get("/api/catalog")
+@query_budget(5)
+async def catalog_page_json(
+    request: Request,
+    search: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    size: Optional[str] = Query(None),
+    gender: Optional[str] = Query(None),
+    after: Optional[int] = Query(None, ge=0),
+    limit: int = Query(CATALOG_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    """JSON catalog page for infinite scroll; includes the rendered cards"""
+    products, next_cursor = await _catalog_products(db, search, category, status, size, gender, after, limit)
+    favourite_ids = await get_favourite_ids(request, db, [p.id for p in products])
+    html = templates.get_template("catalog_cards.html").render({"products": products, "favourite_ids": favourite_ids})
+    return JSONResponse({
+        "products": [
+            {
+                "id": p.id,
+                "name": p.name,
+                "price": p.price,
+                "category": p.category,
+                "status": p.status,
+                "gender": p.gender,
+                "image_url": p.image_url,
+                "images": p.get_images_list(),
+                "sizes": p.get_sizes_list(),
+                "is_favourited": p.id in favourite_ids
+            }
+            for p in products
+        ],
+        "html": html,
+        "next_cursor": next_cursor
+    })
+
 @router.get("/admin/analytics", response_class=HTMLResponse)
-async def admin_analytics(request: Request, db: Session = Depends(get_db)):
-    """Admin analytics: top searched and favourited products"""
-    current_admin = get_current_admin(request, db)
+async def admin_analytics(
+    request: Request,
+    bucket: str = Query("day"),
+    days: int = Query(ANALYTICS_TREND_DAYS, ge=1, le=366),
+    db: AsyncSession = Depends(get_db)
+):
+    """Admin analytics: top searched and favourited products, with daily or weekly trends"""
+    current_admin = await get_current_admin(request, db)
     if not current_admin:
         return RedirectResponse(url="/auth/login", status_code=status.HTTP_302_FOUND)
+    if bucket not in TREND_BUCKETS:
+        bucket = "day"
 
     try:
-        # Load search counts
-        search_stats = _load_search_stats()  # {product_id(str): count}
-
-        # Favourite counts via aggregate
-        fav_counts = dict(
-            db.query(UserFavourite.product_id, func.count(UserFavourite.id))
-              .group_by(UserFavourite.product_id)
-              .all()
-        )
-
-        # Build combined rows for all products that have either metric
-        product_ids = set(int(pid) for pid in search_stats.keys()) | set(fav_counts.keys())
-        # Also include all products to show zeros for others (optional)
-        all_products = db.query(Product).all()
-        product_map = {p.id: p for p in all_products}
-        rows = []
-        for pid, product in product_map.items():
-            searches = int(search_stats.get(str(pid), 0))
-            favs = int(fav_counts.get(pid, 0))
-            rows.append({
-                "id": pid,
-                "name": product.name,
-                "searches": searches,
-                "favourites": favs
-            })
-
-        # Sort by searches desc, then favourites desc
-        rows.sort(key=lambda r: (r["searches"], r["favourites"]), reverse=True)
+        # Write this worker's buffered searches so the page is current
+        await run_in_threadpool(search_counter.flush)
+
+        # Top-N straight off the ranking index
+        top = (await db.execute(
+            select(Product.id, Product.name, ProductStat.search_count, ProductStat.favourite_count)
+            .join(ProductStat, ProductStat.product_id == Product.id)
+            .order_by(ProductStat.search_count.desc(), ProductStat.favourite_count.desc())
+            .limit(ANALYTICS_TOP_N)
+        )).all()
+        rows = [
+            {"id": pid, "name": name, "searches": searches, "favourites": favourites}
+            for pid, name, searches, favourites in top
+        ]
+
+        # Trends from the daily rollup (one row per day after the GROUP BY)
+        until = date.today()
+        since = until - timedelta(days=days - 1)
+        daily = (await db.execute(
+            select(ProductStatDaily.day, func.sum(ProductStatDaily.searches), func.sum(ProductStatDaily.favourites))
+            .where(ProductStatDaily.day >= since)
+            .group_by(ProductStatDaily.day)
+        )).all()
+        trend = trend_buckets(daily, since, until, bucket)
 
         # Top 5 for chart
         top5 = rows[:5]
@@ -240,59 +249,77 @@ async def admin_analytics(request: Request, db: Session = Depends(get_db)):
         return templates.TemplateResponse("analytics.html", {
             "request": request,
             "rows": rows,
+            "top_n": ANALYTICS_TOP_N,
             "chart_labels": chart_labels,
-            "chart_data": chart_data
+            "chart_data": chart_data,
+            "bucket": bucket,
+            "days": days,
+            "trend_labels": [t["start"].isoformat() for t in trend],
+            "trend_searches": [t["searches"] for t in trend],
+            "trend_favourites": [t["favourites"] for t in trend]
         })
     except Exception as e:
-        print(f"Error loading analytics: {e}")
+        logger.error("Error loading analytics: %s", e)
         return templates.TemplateResponse("analytics.html", {
             "request": request,
             "rows": [],
+            "top_n": ANALYTICS_TOP_N,
             "chart_labels": [],
-            "chart_data": []
+            "chart_data": [],
+            "bucket": bucket,
+            "days": days,
+            "trend_labels": [],
+            "trend_searches": [],
+            "trend_favourites": []
         })
 
 @router.get("/{product_id}", response_class=HTMLResponse)
-async def product_detail(product_id: int, request: Request, db: Session = Depends(get_db)):
+@query_budget(5)
+async def product_detail(product_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Product detail page"""
     try:
-        # Debug: Print all product IDs
-        all_products = db.query(Product).all()
-        print(f"DEBUG: All products in database: {[p.id for p in all_products]}")
-        print(f"DEBUG: Looking for product ID: {product_id}")
-        
-        # Get product
-        product = db.query(Product).filter(Product.id == product_id).first()
-        
-        if not product:
-            print(f"DEBUG: Product with ID {product_id} not found")
+        # Only logged-in users cost a query here; the rest of the page is cached per product
+        is_favourited = product_id in await get_favourite_ids(request, db, [product_id])
+        cache_key = (product_id, str(request.base_url), is_favourited)
+        html = detail_cache.get(cache_key)
+        if html is not None:
+            return HTMLResponse(html)
+
+        generation = detail_cache.generation
+        # The product and up to 4 related products (same category) in one query
+        category = select(Product.category).where(Product.id == product_id).scalar_subquery()
+        rows = (await db.scalars(
+            select(Product)
+            .where(or_(Product.id == product_id, Product.category == category))
+            .order_by((Product.id == product_id).desc(), Product.id)
+            .limit(5)
+        )).all()
+
+        if not rows or rows[0].id != product_id:
+            logger.debug("Product with ID %s not found", product_id)
             raise HTTPException(status_code=404, detail="Product not found")
-        
-        print(f"DEBUG: Found product: {product.name} (ID: {product.id})")
-        
-        # Get related products (same category, excluding current product)
-        related_products = db.query(Product).filter(
-            Product.category == product.category,
-            Product.id != product.id
-        ).limit(4).all()
-        
-        print(f"DEBUG: Found {len(related_products)} related products")
-        
-        return templates.TemplateResponse("product_detail.html", {
+        product, related_products = rows[0], rows[1:]
+
+        html = templates.get_template("product_detail.html").render({
             "request": request,
             "product": product,
-            "related_products": related_products
+            "related_products": related_products,
+            "is_favourited": is_favourited
         })
+        detail_cache.set(cache_key, html, product.category, generation)
+        return HTMLResponse(html)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error loading product detail: {e}")
+        logger.error("Error loading product detail: %s", e)
         raise HTTPException(status_code=404, detail="Product not found")
 
 @router.get("/debug/list", response_class=HTMLResponse)
-async def debug_products_list(request: Request, db: Session = Depends(get_db)):
+async def debug_products_list(request: Request, db: AsyncSession = Depends(get_db)):
     """Debug route to list all products"""
     try:
-        products = db.query(Product).order_by(Product.id).all()
+        products = (await db.scalars(select(Product).order_by(Product.id))).all()
         product_list = []
         for p in products:
             product_list.append(f"ID: {p.id}, Name: {p.name}, Category: {p.category}")
@@ -322,6 +349,54 @@ async def debug_products_list(request: Request, db: Session = Depends(get_db)):
         </html>
         """)
 
+def _dashboard_filters(search: Optional[str], category: Optional[str], status: Optional[str]) -> list:
+    filters = []
+    if search:
+        filters.append(Product.name.ilike(f"%{search}%"))
+    if category:
+        filters.append(Product.category == category)
+    if status:
+        filters.append(Product.status == status)
+    return filters
+
+
+async def _dashboard_stats(db: AsyncSession, search: Optional[str], category: Optional[str],
+                           status: Optional[str]) -> dict:
+    """Product counts by status and by category, from one GROUP BY; cached until a product write"""
+    key = (search, category, status)
+    stats = dashboard_stats_cache.get(key)
+    if stats is not None:
+        return stats
+    generation = dashboard_stats_cache.generation
+    rows = (await db.execute(
+        select(Product.status, Product.category, func.count(Product.id))
+        .where(*_dashboard_filters(search, category, status))
+        .group_by(Product.status, Product.category)
+    )).all()
+
+    status_counts = Counter()
+    category_stats = Counter()
+    for product_status, product_category, count in rows:
+        status_counts[product_status] += count
+        category_stats[product_category] += count
+    stats = {
+        "total_products": sum(status_counts.values()),
+        "available_products": status_counts["Available"],
+        "out_of_stock": status_counts["Out of Stock"],
+        "category_stats": dict(category_stats),
+    }
+    dashboard_stats_cache.set(key, stats, None, generation)
+    return stats
+
+
+def _dashboard_error(code: Optional[str]) -> Optional[str]:
+    """Message for the ?error= code the admin form handlers redirect with"""
+    if code == "upload_rejected":
+        return f"Upload rejected: images must be JPEG, PNG, GIF or WebP files up to {max_upload_size_label()}"
+    if code == "update_failed":
+        return "Error updating product"
+    return None
+
 @router.get("/admin/dashboard", response_class=HTMLResponse)
 async def admin_dashboard(
     request: Request,
@@ -329,10 +404,13 @@ async def admin_dashboard(
     search: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    after: Optional[int] = Query(None, ge=0),
+    limit: int = Query(DASHBOARD_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    error: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db)
 ):
     """Admin dashboard for product management"""
-    current_admin = get_current_admin(request, db)
+    current_admin = await get_current_admin(request, db)
     
     if not current_admin:
         # Show dashboard with login form instead of redirecting
@@ -354,48 +432,31 @@ async def admin_dashboard(
         })
     
     try:
-        # Build query with optional filters for admin view
-        query = db.query(Product)
-        if search:
-            query = query.filter(Product.name.ilike(f"%{search}%"))
-        if category:
-            query = query.filter(Product.category == category)
-        if status:
-            query = query.filter(Product.status == status)
-
-        # Get products ordered by ID to maintain consistent positions
-        products = query.order_by(Product.id).all()
-        
-        # Get statistics
-        total_products = len(products)
-        available_products = len([p for p in products if p.status == "Available"])
-        out_of_stock = len([p for p in products if p.status == "Out of Stock"])
-        
-        # Get products by category
-        category_stats = {}
-        for product in products:
-            category = product.category
-            if category not in category_stats:
-                category_stats[category] = 0
-            category_stats[category] += 1
+        # Get one page of products ordered by ID to maintain consistent positions
+        products, next_cursor = await _paginate(
+            db, select(Product).where(*_dashboard_filters(search, category, status)), after, limit)
+        
+        # Statistics for the whole filtered set, not just this page
+        stats = await _dashboard_stats(db, search, category, status)
         
         return templates.TemplateResponse("dashboard.html", {
             "request": request,
             "products": products,
-            "total_products": total_products,
-            "available_products": available_products,
-            "out_of_stock": out_of_stock,
-            "category_stats": category_stats,
+            **stats,
             "categories": CATEGORIES,
             "statuses": STATUSES,
             "show_add": show_add,
             "current_search": search,
             "current_category": category,
-            "current_status": status
+            "current_status": status,
+            "current_after": after,
+            "next_cursor": next_cursor,
+            "page_size": limit,
+            "error": _dashboard_error(error)
         })
         
     except Exception as e:
-        print(f"Error loading admin dashboard: {e}")
+        logger.error("Error loading admin dashboard: %s", e)
         return templates.TemplateResponse("dashboard.html", {
             "request": request,
             "products": [],
@@ -408,10 +469,26 @@ async def admin_dashboard(
             "current_status": status
         })
 
+@router.get("/admin/api/stats")
+async def admin_dashboard_stats(
+    request: Request,
+    search: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Dashboard counters as JSON, for refreshing them without reloading the page"""
+    current_admin = await get_current_admin(request, db)
+    
+    if not current_admin:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    return await _dashboard_stats(db, search, category, status)
+
 @router.get("/admin/add", response_class=HTMLResponse)
-async def add_product_page(request: Request, db: Session = Depends(get_db)):
+async def add_product_page(request: Request, db: AsyncSession = Depends(get_db)):
     """Add product page - redirects to dashboard with modal"""
-    current_admin = get_current_admin(request, db)
+    current_admin = await get_current_admin(request, db)
     
     if not current_admin:
         return RedirectResponse(url="/auth/login", status_code=status.HTTP_302_FOUND)
@@ -427,35 +504,23 @@ async def add_product(
     price: float = Form(...),
     category: str = Form(...),
     gender: str = Form(...),
-    status: str = Form(...),
+    product_status: str = Form(..., alias="status"),
     image_url: str = Form(None),
     sizes: List[str] = Form([]),
     images: List[UploadFile] = File([]),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Add new product"""
-    current_admin = get_current_admin(request, db)
+    current_admin = await get_current_admin(request, db)
     
     if not current_admin:
         return RedirectResponse(url="/auth/login", status_code=status.HTTP_302_FOUND)
     
     try:
-        print(f"DEBUG: Add product - received {len(images)} images")
-        for i, image in enumerate(images):
-            print(f"DEBUG: Image {i}: filename={image.filename}, content_type={image.content_type}")
-        
-        # Save uploaded images
-        uploaded_images = []
-        for image in images:
-            if image.filename:
-                print(f"DEBUG: Processing image: {image.filename}")
-                image_path = save_uploaded_file(image)
-                uploaded_images.append(image_path)
-                print(f"DEBUG: Image saved to: {image_path}")
-            else:
-                print(f"DEBUG: Skipping image with no filename")
-        
-        print(f"DEBUG: Total uploaded images: {len(uploaded_images)}")
+        # Save uploaded images (streamed to disk concurrently, deduplicated by content)
+        uploaded_images = await save_uploads(images)
+        generate_derivatives(uploaded_images)
+        logger.debug("Saved %s uploaded images", len(uploaded_images))
         
         # Create product
         product = Product(
@@ -463,25 +528,24 @@ async def add_product(
             description=description,
             price=price,
             category=category,
-            status=status,
-            image_url=image_url,
-            images=json.dumps(uploaded_images) if uploaded_images else None,
-            sizes=json.dumps(sizes) if sizes else None
+            status=product_status,
+            gender=gender if gender in GENDERS else None,
+            image_url=image_url
         )
-        # Persist gender in external map (since DB lacks gender column)
-        try:
-            gmap = _load_gender_map()
-            gmap[str(product.id)] = gender
-            _save_gender_map(gmap)
-        except Exception as e:
-            print(f"WARN: could not persist gender map (add): {e}")
+        product.set_images(uploaded_images)
+        product.set_sizes(_parse_sizes(sizes))
         db.add(product)
-        db.commit()
+        await db.commit()
+        index_product(product)
+        _products_changed(product.category)
         
         return RedirectResponse(url="/products/admin/dashboard", status_code=status.HTTP_302_FOUND)
         
     except Exception as e:
-        print(f"Error adding product: {e}")
+        if isinstance(e, UploadRejected):
+            logger.warning("Rejected upload for new product: %s", e)
+        else:
+            logger.error("Error adding product: %s", e)
         return templates.TemplateResponse("dashboard.html", {
             "request": request,
             "products": [],
@@ -489,20 +553,20 @@ async def add_product(
             "sizes": SIZES,
             "statuses": STATUSES,
             "show_add_form": True,
-            "error": "Error adding product"
+            "error": f"Upload rejected: {e}" if isinstance(e, UploadRejected) else "Error adding product"
         })
 
 @router.get("/admin/edit/{product_id}", response_class=HTMLResponse)
-async def edit_product_page(product_id: int, request: Request, db: Session = Depends(get_db)):
+async def edit_product_page(product_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Edit product page"""
-    current_admin = get_current_admin(request, db)
+    current_admin = await get_current_admin(request, db)
     
     if not current_admin:
         return RedirectResponse(url="/auth/login", status_code=status.HTTP_302_FOUND)
     
     try:
         # Get product
-        product = db.query(Product).filter(Product.id == product_id).first()
+        product = await db.scalar(select(Product).where(Product.id == product_id))
         
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
@@ -511,7 +575,7 @@ async def edit_product_page(product_id: int, request: Request, db: Session = Dep
         return RedirectResponse(url="/products/admin/dashboard", status_code=status.HTTP_302_FOUND)
         
     except Exception as e:
-        print(f"Error loading product for edit: {e}")
+        logger.error("Error loading product for edit: %s", e)
         raise HTTPException(status_code=404, detail="Product not found")
 
 @router.post("/admin/edit/{product_id}")
@@ -528,209 +592,183 @@ async def edit_product(
     sizes: List[str] = Form([]),
     images: List[UploadFile] = File([]),
     images_to_remove: str = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update product"""
-    current_admin = get_current_admin(request, db)
+    current_admin = await get_current_admin(request, db)
     
     if not current_admin:
         return RedirectResponse(url="/auth/login", status_code=status.HTTP_302_FOUND)
     
     try:
         # Get product
-        product = db.query(Product).filter(Product.id == product_id).first()
+        product = await db.scalar(select(Product).where(Product.id == product_id))
         
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        print(f"DEBUG: Edit product - received {len(images)} images")
-        for i, image in enumerate(images):
-            print(f"DEBUG: Image {i}: filename={image.filename}, content_type={image.content_type}")
-        
-        # Save uploaded images
-        uploaded_images = []
-        for image in images:
-            if image.filename:
-                print(f"DEBUG: Processing image: {image.filename}")
-                image_path = save_uploaded_file(image)
-                uploaded_images.append(image_path)
-                print(f"DEBUG: Image saved to: {image_path}")
-            else:
-                print(f"DEBUG: Skipping image with no filename")
-        
-        print(f"DEBUG: Total uploaded images: {len(uploaded_images)}")
+        # Save uploaded images (streamed to disk concurrently, deduplicated by content)
+        uploaded_images = await save_uploads(images)
+        generate_derivatives(uploaded_images)
+        logger.debug("Saved %s uploaded images", len(uploaded_images))
         
         # Update product
+        old_category = product.category
         product.name = name
         product.description = description
         product.price = price
         product.category = category
         product.status = product_status
         product.image_url = image_url
-        product.sizes = json.dumps(sizes) if sizes else None
-        # Persist gender tag inside description (temporary until DB column is added)
-        if gender in ("Male", "Female"):
-            # remove existing gender tag
-            if product.description:
-                product.description = product.description.replace("Gender: Male", "").replace("Gender: Female", "").strip()
-            if product.description:
-                product.description = f"{product.description}\nGender: {gender}".strip()
-            else:
-                product.description = f"Gender: {gender}"
+        product.set_sizes(_parse_sizes(sizes))
+        if gender in GENDERS:
+            product.gender = gender
         
         # Handle image removal first
+        removed_images = []
         if images_to_remove:
             try:
                 # Parse the comma-separated list of images to remove
                 images_to_remove_list = [img.strip() for img in images_to_remove.split(',') if img.strip()]
-                print(f"DEBUG: Images to remove: {images_to_remove_list}")
+                logger.debug("Images to remove: %s", images_to_remove_list)
                 
                 # Get current images
-                current_images = []
-                if product.images:
-                    try:
-                        current_images = json.loads(product.images)
-                    except Exception:
-                        current_images = []
+                current_images = product.get_images_list()
                 
                 # Remove the specified images
                 for img_to_remove in images_to_remove_list:
                     if img_to_remove in current_images:
                         current_images.remove(img_to_remove)
-                        print(f"DEBUG: Removed image: {img_to_remove}")
-                        
-                        # Try to delete the actual file from disk
-                        try:
-                            if img_to_remove.startswith('/static/uploads/'):
-                                file_path = img_to_remove.replace('/static/uploads/', 'static/uploads/')
-                                if os.path.exists(file_path):
-                                    os.remove(file_path)
-                                    print(f"DEBUG: File {file_path} deleted from disk")
-                        except Exception as e:
-                            print(f"WARNING: Could not delete file from disk: {e}")
+                        removed_images.append(img_to_remove)
+                        logger.debug("Removed image: %s", img_to_remove)
                 
                 # Update product images
-                product.images = json.dumps(current_images) if current_images else None
-                print(f"DEBUG: Updated product images: {current_images}")
+                product.set_images(current_images)
+                logger.debug("Updated product images: %s", current_images)
                 
             except Exception as e:
-                print(f"ERROR: Failed to process image removal: {e}")
+                logger.error("Failed to process image removal: %s", e)
         
         # Add new images to existing ones
         if uploaded_images:
-            existing_images = []
-            if product.images:
-                try:
-                    existing_images = json.loads(product.images)
-                except Exception:
-                    existing_images = []
-            product.images = json.dumps(existing_images + uploaded_images)
+            product.set_images(product.get_images_list() + uploaded_images)
+
+        await db.commit()
+        index_product(product)
+        _products_changed(old_category, product.category)
 
-        db.commit()
+        # Delete removed files from disk once no product references them
+        for removed in removed_images:
+            if await delete_upload_if_unused(db, removed):
+                remove_derivatives(removed)
         
         return RedirectResponse(url="/products/admin/dashboard", status_code=status.HTTP_302_FOUND)
         
+    except UploadRejected as e:
+        logger.warning("Rejected upload for product %s: %s", product_id, e)
+        return RedirectResponse(url="/products/admin/dashboard?error=upload_rejected", status_code=status.HTTP_302_FOUND)
     except Exception as e:
-        print(f"Error updating product: {e}")
+        logger.error("Error updating product: %s", e)
         return RedirectResponse(url="/products/admin/dashboard?error=update_failed", status_code=status.HTTP_302_FOUND)
 
 @router.delete("/admin/remove-image/{product_id}")
-async def remove_product_image(product_id: int, request: Request, image_path: str = Query(...), db: Session = Depends(get_db)):
+async def remove_product_image(product_id: int, request: Request, image_path: str = Query(...), db: AsyncSession = Depends(get_db)):
     """Remove a specific image from a product"""
-    current_admin = get_current_admin(request, db)
+    current_admin = await get_current_admin(request, db)
     
     if not current_admin:
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     try:
         # Get product
-        product = db.query(Product).filter(Product.id == product_id).first()
+        product = await db.scalar(select(Product).where(Product.id == product_id))
         
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        print(f"DEBUG: Removing image {image_path} from product {product_id}")
+        logger.debug("Removing image %s from product %s", image_path, product_id)
         
         # Get current images
-        current_images = []
-        if product.images:
-            try:
-                current_images = json.loads(product.images)
-            except Exception:
-                current_images = []
+        current_images = product.get_images_list()
         
         # Remove the specified image
         if image_path in current_images:
             current_images.remove(image_path)
-            product.images = json.dumps(current_images) if current_images else None
-            db.commit()
+            product.set_images(current_images)
+            await db.commit()
+            _products_changed(product.category)
             
-            print(f"DEBUG: Image removed successfully. Remaining images: {len(current_images)}")
+            logger.debug("Image removed successfully. Remaining images: %s", len(current_images))
             
-            # Try to delete the actual file
-            try:
-                if image_path.startswith('/static/uploads/'):
-                    file_path = image_path.replace('/static/uploads/', 'static/uploads/')
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        print(f"DEBUG: File {file_path} deleted from disk")
-            except Exception as e:
-                print(f"WARNING: Could not delete file from disk: {e}")
+            # Delete the file unless another product shares it
+            if await delete_upload_if_unused(db, image_path):
+                remove_derivatives(image_path)
             
             return {"success": True, "message": "Image removed successfully", "remaining_images": len(current_images)}
         else:
             raise HTTPException(status_code=404, detail="Image not found in product")
         
     except Exception as e:
-        print(f"Error removing image: {e}")
+        logger.error("Error removing image: %s", e)
         raise HTTPException(status_code=500, detail="Failed to remove image")
 
 @router.delete("/admin/delete/{product_id}")
-async def delete_product(product_id: int, request: Request, db: Session = Depends(get_db)):
+async def delete_product(product_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Delete product"""
-    current_admin = get_current_admin(request, db)
+    current_admin = await get_current_admin(request, db)
     
     if not current_admin:
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     try:
         # Get product
-        product = db.query(Product).filter(Product.id == product_id).first()
+        product = await db.scalar(select(Product).where(Product.id == product_id))
         
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        # Delete product
-        db.delete(product)
-        db.commit()
+        # Delete product, and the favourites and stats pointing at it
+        await db.execute(delete(UserFavourite).where(UserFavourite.product_id == product_id))
+        await db.execute(delete(ProductStatDaily).where(ProductStatDaily.product_id == product_id))
+        await db.execute(delete(ProductStat).where(ProductStat.product_id == product_id))
+        await db.delete(product)
+        await db.commit()
+        remove_product(product_id)
+        _products_changed(product.category)
         
         return {"message": "Product deleted successfully"}
         
     except Exception as e:
-        print(f"Error deleting product: {e}")
+        logger.error("Error deleting product: %s", e)
         raise HTTPException(status_code=500, detail="Failed to delete product")
 
 @router.post("/admin/update-status/{product_id}")
-async def update_product_status(product_id: int, request: Request, status: str = Form(...), db: Session = Depends(get_db)):
+async def update_product_status(
+    product_id: int,
+    request: Request,
+    product_status: str = Form(..., alias="status"),
+    db: AsyncSession = Depends(get_db)
+):
     """Update product status"""
-    current_admin = get_current_admin(request, db)
+    current_admin = await get_current_admin(request, db)
     
     if not current_admin:
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     try:
         # Get product
-        product = db.query(Product).filter(Product.id == product_id).first()
+        product = await db.scalar(select(Product).where(Product.id == product_id))
         
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
         
         # Update status
-        product.status = status
-        db.commit()
+        product.status = product_status
+        await db.commit()
+        _products_changed(product.category)
         
         return RedirectResponse(url="/products/admin/dashboard", status_code=status.HTTP_302_FOUND)
         
     except Exception as e:
-        print(f"Error updating product status: {e}")
+        logger.error("Error updating product status: %s", e)
         raise HTTPException(status_code=500, detail="Failed to update status")
@@ -0,0 +1,214 @@
+"""In-process periodic task runner.
+
+Jobs are async functions registered with ``scheduler.add``; each runs on its
+own asyncio task every ``interval`` seconds. With several uvicorn workers (or
+instances) only the leader runs jobs. Leadership is a lock that dies with its
+holder:
+
+    PostgreSQL  ``pg_try_advisory_lock`` on a connection the leader keeps open
+    otherwise   ``flock`` on a file in ``SCHEDULER_LOCK_DIR`` (one host only;
+                without ``fcntl``, e.g. on Windows, every process leads)
+
+Followers retry on every tick, so another worker takes over within one
+interval when the leader exits. ``scheduler.stats()`` reports runs, failures,
+rows affected and durations per job.
+
+Set ``SCHEDULER_ENABLED=false`` to run no jobs in this process.
+"""
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+import zlib
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import text
+
+from app import database
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_LOCK_DIR = os.getenv("SCHEDULER_LOCK_DIR", tempfile.gettempdir())
+LEADER_LOCK_NAME = "jubair-boot-house-scheduler"
+
+# A job returns how many rows (or items) it handled
+Job = Callable[[], Awaitable[int]]
+
+
+class LeaderLock:
+    """Process-lifetime lock deciding which worker runs scheduled jobs"""
+
+    def __init__(self, name: str = LEADER_LOCK_NAME):
+        self.name = name
+        self.key = zlib.crc32(name.encode())
+        self._connection = None
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._connection is not None or self._file is not None
+
+    async def acquire(self) -> bool:
+        """Take the lock if free; True while this process holds it"""
+        if self.held:
+            return await self._still_held()
+        engine = database.async_engine
+        if engine is not None and engine.dialect.name == "postgresql":
+            connection = await engine.connect()
+            try:
+                acquired = await connection.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key})
+            except Exception:
+                await connection.close()
+                raise
+            if acquired:
+                self._connection = connection
+            else:
+                await connection.close()
+        elif fcntl is not None:
+            lock_file = open(os.path.join(SCHEDULER_LOCK_DIR, f"{self.name}.lock"), "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._file = lock_file
+            except OSError:
+                lock_file.close()
+        else:
+            return True
+        if self.held:
+            logger.info("This worker (pid %s) is now the scheduler leader", os.getpid())
+        return self.held
+
+    async def _still_held(self) -> bool:
+        if self._connection is None:
+            return True
+        try:
+            await self._connection.scalar(text("SELECT 1"))
+            return True
+        except Exception as e:
+            # The connection, and with it the advisory lock, is gone
+            logger.warning("Lost scheduler leader connection: %s", e)
+            await self.release()
+            return False
+
+    async def release(self) -> None:
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            try:
+                await connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            except Exception:
+                pass
+            try:
+                await connection.close()
+            except Exception:
+                pass
+        if self._file is not None:
+            lock_file, self._file = self._file, None
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+
+@dataclass
+class JobStats:
+    runs: int = 0
+    failures: int = 0
+    skipped: int = 0
+    rows: int = 0
+    last_rows: int = 0
+    last_run_at: Optional[float] = None
+    last_duration_seconds: float = 0.0
+    total_duration_seconds: float = 0.0
+
+
+class Scheduler:
+    """Runs registered jobs periodically in the worker holding the leader lock"""
+
+    def __init__(self, lock: Optional[LeaderLock] = None):
+        self.lock = lock or LeaderLock()
+        self._jobs: Dict[str, tuple] = {}
+        self._stats: Dict[str, JobStats] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._lock_guard: Optional[asyncio.Lock] = None
+
+    def add(self, name: str, interval: float, job: Job) -> None:
+        self._jobs[name] = (interval, job)
+        self._stats.setdefault(name, JobStats())
+
+    async def _is_leader(self) -> bool:
+        async with self._lock_guard:
+            try:
+                return await self.lock.acquire()
+            except Exception as e:
+                logger.warning("Could not check scheduler leader lock: %s", e)
+                return False
+
+    async def run_job(self, name: str) -> int:
+        """Run one job now (leader or not) and record its stats"""
+        _, job = self._jobs[name]
+        stats = self._stats[name]
+        started = time.monotonic()
+        stats.last_run_at = time.time()
+        try:
+            rows = await job()
+        except Exception:
+            stats.failures += 1
+            logger.exception("Scheduled job %s failed", name)
+            rows = 0
+        duration = time.monotonic() - started
+        stats.runs += 1
+        stats.rows += rows
+        stats.last_rows = rows
+        stats.last_duration_seconds = duration
+        stats.total_duration_seconds += duration
+        if rows:
+            logger.info("Scheduled job %s: %s rows in %.2fs", name, rows, duration)
+        else:
+            logger.debug("Scheduled job %s: nothing to do (%.2fs)", name, duration)
+        return rows
+
+    async def _loop(self, name: str) -> None:
+        interval, _ = self._jobs[name]
+        # Spread the first run so workers started together do not all tick at once
+        await asyncio.sleep(random.uniform(0.1, 1.0) * min(interval, 60))
+        while True:
+            if await self._is_leader():
+                await self.run_job(name)
+            else:
+                self._stats[name].skipped += 1
+            await asyncio.sleep(interval)
+
+    def start(self) -> None:
+        if not SCHEDULER_ENABLED or self._tasks:
+            return
+        self._lock_guard = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        for name in self._jobs:
+            self._tasks[name] = loop.create_task(self._loop(name))
+
+    async def stop(self) -> None:
+        tasks, self._tasks = list(self._tasks.values()), {}
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.lock.release()
+
+    def stats(self) -> dict:
+        return {
+            "leader": self.lock.held,
+            "jobs": {name: {"interval_seconds": self._jobs[name][0], **asdict(stats)}
+                     for name, stats in self._stats.items()},
+        }
+
+
+scheduler = Scheduler()
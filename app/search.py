@@ -0,0 +1,256 @@
+"""Product search.
+
+On PostgreSQL the catalog is searched through the ``products.search_vector``
+generated tsvector column (GIN indexed, see alembic revision 0002) and ranked
+with ``ts_rank`` in a single query. Everywhere else (SQLite in development) an
+in-process inverted index over name, category and description is used. It is
+built lazily from the database on first search and updated by the admin
+product handlers through ``index_product`` / ``remove_product``.
+
+Those updates only reach the worker that handled the edit, so each search
+also reads the product count and highest id and rebuilds the index when they
+changed (products added or deleted by another worker). Edits made in another
+worker show up once the index is older than ``SEARCH_INDEX_MAX_AGE_SECONDS``.
+
+Results are paged by (rank, id) with the last product shown as the cursor, and
+the caller's filters apply before the page is cut, so every page costs the
+same however deep it is and only the page's products (and their images and
+sizes) are loaded.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, func, inspect, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import sql_profiler
+from app.models import Product
+
+logger = logging.getLogger(__name__)
+
+# In-process index: ranked ids checked against the SQL filters per query
+SEARCH_FILTER_CHUNK = 500
+# In-process index: rebuilt at least this often to pick up other workers' edits
+SEARCH_INDEX_MAX_AGE_SECONDS = int(os.getenv("SEARCH_INDEX_MAX_AGE_SECONDS", "60"))
+
+# Field weights; mirror the setweight() labels used for the tsvector column
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0}
+
+# Postgres text search configuration; 'simple' keeps brand and model names intact
+TS_CONFIG = "simple"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into lowercase search terms"""
+    if not text:
+        return []
+    return _TOKEN_RE.findall(text.lower())
+
+
+class InvertedIndex:
+    """Thread-safe in-memory inverted index of product text"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._doc_terms: Dict[int, Set[str]] = {}
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        self.loaded = False
+        self.built_at = 0.0
+        # (product count, highest id) when built; another worker adding or deleting changes it
+        self.signature: Optional[Tuple[int, Optional[int]]] = None
+
+    def _add(self, product_id: int, fields: Dict[str, Optional[str]]) -> None:
+        terms: Dict[str, float] = {}
+        for field, value in fields.items():
+            weight = FIELD_WEIGHTS.get(field, 1.0)
+            for term in tokenize(value):
+                terms[term] = max(terms.get(term, 0.0), weight)
+        for term, weight in terms.items():
+            if term not in self._postings:
+                self._postings[term] = {}
+                self._vocabulary_dirty = True
+            self._postings[term][product_id] = weight
+        self._doc_terms[product_id] = set(terms)
+
+    def _remove(self, product_id: int) -> None:
+        for term in self._doc_terms.pop(product_id, ()):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                self._vocabulary_dirty = True
+
+    def build(self, rows: Iterable[Tuple[int, Optional[str], Optional[str], Optional[str]]],
+              signature: Optional[Tuple[int, Optional[int]]] = None) -> None:
+        """Replace the index contents with (id, name, category, description) rows"""
+        with self._lock:
+            self._postings = {}
+            self._doc_terms = {}
+            for product_id, name, category, description in rows:
+                self._add(product_id, {"name": name, "category": category, "description": description})
+            self._vocabulary_dirty = True
+            self.loaded = True
+            self.built_at = time.monotonic()
+            self.signature = signature
+
+    def upsert(self, product_id: int, name: Optional[str], category: Optional[str], description: Optional[str]) -> None:
+        with self._lock:
+            self._remove(product_id)
+            self._add(product_id, {"name": name, "category": category, "description": description})
+
+    def remove(self, product_id: int) -> None:
+        with self._lock:
+            self._remove(product_id)
+
+    def _expand(self, token: str) -> List[str]:
+        """Return indexed terms that start with ``token`` (prefix match)"""
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        start = bisect_left(self._vocabulary, token)
+        terms = []
+        for term in self._vocabulary[start:]:
+            if not term.startswith(token):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, tokens: List[str]) -> List[Tuple[int, float]]:
+        """Rank products matching any token; products matching more tokens rank first"""
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = {}
+        with self._lock:
+            for token in dict.fromkeys(tokens):
+                best: Dict[int, float] = {}
+                for term in self._expand(token):
+                    # Exact term hits outrank prefix completions
+                    factor = 1.0 if term == token else 0.5
+                    for product_id, weight in self._postings[term].items():
+                        best[product_id] = max(best.get(product_id, 0.0), weight * factor)
+                for product_id, score in best.items():
+                    scores[product_id] = scores.get(product_id, 0.0) + score
+                    matched[product_id] = matched.get(product_id, 0) + 1
+        return sorted(scores.items(), key=lambda item: (-matched[item[0]], -item[1], item[0]))
+
+
+_index = InvertedIndex()
+_postgres_fts: Optional[bool] = None
+
+
+async def _use_postgres_fts(db: AsyncSession) -> bool:
+    """True when the database has the generated search_vector column"""
+    global _postgres_fts
+    if _postgres_fts is None:
+        if db.bind.dialect.name != "postgresql":
+            _postgres_fts = False
+        else:
+            try:
+                columns = await db.run_sync(lambda session: inspect(session.connection()).get_columns("products"))
+                _postgres_fts = any(c["name"] == "search_vector" for c in columns)
+            except Exception as e:
+                logger.warning("could not inspect products for search_vector: %s", e)
+                _postgres_fts = False
+            if not _postgres_fts:
+                logger.warning("products.search_vector missing; run 'alembic upgrade head'. Using in-process search index.")
+    return _postgres_fts
+
+
+async def _ensure_index_current(db: AsyncSession) -> None:
+    """(Re)build the index on first use, when products were added or deleted, or when it is stale"""
+    count, max_id = (await db.execute(select(func.count(Product.id), func.max(Product.id)))).one()
+    if (_index.loaded and _index.signature == (count, max_id)
+            and time.monotonic() - _index.built_at < SEARCH_INDEX_MAX_AGE_SECONDS):
+        # Index upkeep, not the request's own work: keep it out of the route's query budget
+        sql_profiler.excuse_queries(1)
+        return
+    rows = (await db.execute(select(Product.id, Product.name, Product.category, Product.description))).all()
+    _index.build(rows, (count, max_id))
+    sql_profiler.excuse_queries(2)
+
+
+def _page(rows: List[Product], limit: int):
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+async def search_products(db: AsyncSession, text: str, query=None, after: Optional[int] = None,
+                          limit: int = 24) -> Optional[Tuple[List[Product], Optional[int]]]:
+    """One page of products matching ``text`` in rank order; returns (products, next_cursor).
+
+    ``query`` is an optional pre-filtered ``select(Product)`` (category/status/
+    size/gender). ``after`` is the last product of the previous page. Returns
+    None when ``after`` is not a match, i.e. the caller is paging another list.
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return None if after else ([], None)
+    if query is None:
+        query = select(Product)
+
+    if await _use_postgres_fts(db):
+        vector = literal_column("products.search_vector")
+        ts_query = func.to_tsquery(
+            literal_column(f"'{TS_CONFIG}'"),
+            " | ".join(f"{token}:*" for token in tokens)
+        )
+        matches = vector.op("@@")(ts_query)
+        rank = func.ts_rank(vector, ts_query)
+        stmt = query.where(matches)
+        if after:
+            # Rank of the cursor product, computed the same way (uncorrelated: its own FROM products)
+            after_rank = select(rank).where(Product.id == after).scalar_subquery().correlate(None)
+            stmt = stmt.where(or_(rank < after_rank, and_(rank == after_rank, Product.id > after)))
+        rows = (await db.scalars(stmt.order_by(rank.desc(), Product.id).limit(limit + 1))).all()
+        if after and not rows and await db.scalar(select(Product.id).where(Product.id == after, matches)) is None:
+            return None
+        return _page(rows, limit)
+
+    await _ensure_index_current(db)
+    ranked = [product_id for product_id, _ in _index.search(tokens)]
+    start = 0
+    if after:
+        try:
+            start = ranked.index(after) + 1
+        except ValueError:
+            return None
+    # Walk the ranking from the cursor, keeping ids that pass the filters, until a page is full
+    page_ids: List[int] = []
+    filter_ids = query.with_only_columns(Product.id)
+    for chunk_start in range(start, len(ranked), SEARCH_FILTER_CHUNK):
+        chunk = ranked[chunk_start:chunk_start + SEARCH_FILTER_CHUNK]
+        if query.whereclause is None:
+            allowed = set(chunk)
+        else:
+            allowed = set((await db.scalars(filter_ids.where(Product.id.in_(chunk)))).all())
+        page_ids += [product_id for product_id in chunk if product_id in allowed]
+        if len(page_ids) > limit:
+            break
+    if not page_ids:
+        return [], None
+    next_cursor = page_ids[limit - 1] if len(page_ids) > limit else None
+    page_ids = page_ids[:limit]
+    by_id = {p.id: p for p in (await db.scalars(select(Product).where(Product.id.in_(page_ids)))).all()}
+    return [by_id[product_id] for product_id in page_ids if product_id in by_id], next_cursor
+
+
+def index_product(product: Product) -> None:
+    """Refresh a product's entry after it was created or edited"""
+    if _index.loaded:
+        _index.upsert(product.id, product.name, product.category, product.description)
+
+
+def remove_product(product_id: int) -> None:
+    """Drop a deleted product from the index"""
+    if _index.loaded:
+        _index.remove(product_id)
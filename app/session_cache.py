@@ -0,0 +1,179 @@
+"""Session validation cache.
+
+``get_current_admin`` / ``get_current_user`` consult this cache before the
+``sessions`` table. Entries are small ``CachedSession`` snapshots keyed by
+session_id and live for ``SESSION_CACHE_TTL_SECONDS``.
+
+The default backend is an in-process TTL/LRU map. With several uvicorn
+workers a logout only evicts the entry in the worker that handled it, so the
+other workers may accept the session for up to one TTL. Set
+``SESSION_CACHE_URL=redis://...`` (requires the ``redis`` package) to share
+the cache between workers, or pass any object with get/set/delete to
+``configure_backend``; its methods may be plain or coroutines.
+
+The cache is read on every authenticated request, so ``SessionCache`` methods
+are coroutines and the Redis backend uses ``redis.asyncio``: a round trip to
+Redis never blocks the event loop.
+"""
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_TTL_SECONDS = int(os.getenv("SESSION_CACHE_TTL_SECONDS", "60"))
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))
+SESSION_CACHE_URL = os.getenv("SESSION_CACHE_URL")
+
+
+@dataclass
+class CachedSession:
+    """Detached copy of the Session columns request handlers read"""
+    session_id: str
+    username: str
+    user_type: str
+    user_id: Optional[int]
+    expires_at: datetime
+    is_active: bool = True
+
+    @classmethod
+    def from_row(cls, row) -> "CachedSession":
+        return cls(
+            session_id=row.session_id,
+            username=row.username,
+            user_type=row.user_type,
+            user_id=row.user_id,
+            expires_at=row.expires_at,
+            is_active=bool(row.is_active),
+        )
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        data["expires_at"] = self.expires_at.isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw) -> "CachedSession":
+        data = json.loads(raw)
+        data["expires_at"] = datetime.fromisoformat(data["expires_at"])
+        return cls(**data)
+
+
+class LocalSessionBackend:
+    """Thread-safe in-process TTL + LRU map"""
+
+    def __init__(self, max_entries: int = SESSION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[CachedSession]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            deadline, value = entry
+            if deadline < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: CachedSession, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisSessionBackend:
+    """Shared backend for multi-worker deployments"""
+
+    prefix = "session-cache:"
+
+    def __init__(self, url: str):
+        # optional dependency, only needed when SESSION_CACHE_URL is set
+        from redis import asyncio as redis_asyncio
+        self._client = redis_asyncio.Redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[CachedSession]:
+        raw = await self._client.get(self.prefix + key)
+        return CachedSession.from_json(raw) if raw else None
+
+    async def set(self, key: str, value: CachedSession, ttl: int) -> None:
+        await self._client.set(self.prefix + key, value.to_json(), ex=ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(self.prefix + key)
+
+    async def clear(self) -> None:
+        async for key in self._client.scan_iter(self.prefix + "*"):
+            await self._client.delete(key)
+
+
+async def _resolve(result):
+    """Await ``result`` if the backend method was a coroutine"""
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
+class SessionCache:
+    def __init__(self, backend, ttl: int = SESSION_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+
+    async def get(self, session_id: str) -> Optional[CachedSession]:
+        try:
+            return await _resolve(self.backend.get(session_id))
+        except Exception as e:
+            logger.warning("session cache read failed: %s", e)
+            return None
+
+    async def set(self, session: CachedSession) -> None:
+        try:
+            await _resolve(self.backend.set(session.session_id, session, self.ttl))
+        except Exception as e:
+            logger.warning("session cache write failed: %s", e)
+
+    async def invalidate(self, session_id: str) -> None:
+        try:
+            await _resolve(self.backend.delete(session_id))
+        except Exception as e:
+            logger.warning("session cache invalidation failed: %s", e)
+
+    async def clear(self) -> None:
+        await _resolve(self.backend.clear())
+
+
+def _default_backend():
+    if SESSION_CACHE_URL:
+        try:
+            return RedisSessionBackend(SESSION_CACHE_URL)
+        except Exception as e:
+            logger.warning("shared session cache unavailable (%s); using in-process cache", e)
+    return LocalSessionBackend()
+
+
+session_cache = SessionCache(_default_backend())
+
+
+def configure_backend(backend) -> None:
+    """Swap the cache backend (any object with get/set/delete/clear)"""
+    session_cache.backend = backend
@@ -0,0 +1,171 @@
+"""Per-request SQL profiling, Server-Timing headers and query budgets.
+
+``install()`` hooks ``before/after_cursor_execute`` on both engines, and
+``ProfilerMiddleware`` opens a ``RequestProfile`` for each HTTP request in a
+context variable, so every statement a request runs (including those made
+through ``run_sync`` or in ``run_in_threadpool``) is counted and timed.
+Templates created by ``app.templating`` add their render time.
+
+Each response gets a ``Server-Timing`` header, visible in the browser's
+network panel::
+
+    Server-Timing: db;dur=3.1;desc="4 queries", render;dur=5.7, total;dur=11.2
+
+Statements slower than ``SLOW_QUERY_MS`` are logged with the route that ran
+them. Handlers can declare how many statements they may issue::
+
+    @router.get("/{product_id}")
+    @query_budget(3)
+    async def product_detail(...):
+
+Statements that keep a per-process cache or index current rather than serve
+the request (see ``app.search``) can be left out with ``excuse_queries``.
+Going over budget is logged as a warning, or raises ``QueryBudgetExceeded``
+when ``QUERY_BUDGET_STRICT=true`` (for development and tests), so an N+1
+fails the request instead of slipping into a deploy.
+"""
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from sqlalchemy import event
+
+from app import database
+
+logger = logging.getLogger(__name__)
+
+SQL_PROFILER_ENABLED = os.getenv("SQL_PROFILER_ENABLED", "true").lower() == "true"
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "false").lower() == "true"
+# Logged statements are cut to this many characters; parameters are never logged
+SLOW_QUERY_LOG_CHARS = 500
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a handler issues more statements than its budget"""
+
+
+class RequestProfile:
+    __slots__ = ("scope", "queries", "excused", "db_seconds", "render_seconds")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.queries = 0
+        self.excused = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        """Route template once routing has matched, the raw path before that"""
+        route = self.scope.get("route")
+        return route.path if route is not None else self.scope.get("path", "-")
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("sql_profile", default=None)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+def query_budget(max_queries: int) -> Callable:
+    """Declare the most SQL statements a route handler may run per request"""
+    def decorate(endpoint: Callable) -> Callable:
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorate
+
+
+def excuse_queries(count: int) -> None:
+    """Leave ``count`` statements of the current request out of its query budget"""
+    profile = _current.get()
+    if profile is not None:
+        profile.excused += count
+
+
+def add_render_time(seconds: float) -> None:
+    profile = _current.get()
+    if profile is not None:
+        profile.render_seconds += seconds
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profiler_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_profiler_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    profile = _current.get()
+    if profile is not None:
+        profile.queries += 1
+        profile.db_seconds += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        route = profile.route if profile is not None else "-"
+        logger.warning("Slow query (%.1f ms) on %s: %s", elapsed * 1000, route,
+                       " ".join(statement.split())[:SLOW_QUERY_LOG_CHARS])
+
+
+def install() -> None:
+    """Attach the statement hooks to the app's engines (once)"""
+    if not SQL_PROFILER_ENABLED:
+        return
+    engines = [database.engine]
+    if database.async_engine is not None:
+        engines.append(database.async_engine.sync_engine)
+    for engine in engines:
+        if engine is not None and not event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _server_timing(profile: RequestProfile, total_seconds: float) -> bytes:
+    return (f'db;dur={profile.db_seconds * 1000:.1f};desc="{profile.queries} queries", '
+            f"render;dur={profile.render_seconds * 1000:.1f}, total;dur={total_seconds * 1000:.1f}").encode()
+
+
+def _check_budget(scope, profile: RequestProfile) -> None:
+    budget = getattr(scope.get("endpoint"), "query_budget", None)
+    if budget is None or profile.queries - profile.excused <= budget:
+        return
+    message = f"{scope['method']} {profile.route} ran {profile.queries - profile.excused} SQL statements, budget is {budget}"
+    if QUERY_BUDGET_STRICT:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware opening a RequestProfile per request and adding Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SQL_PROFILER_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope)
+        token = _current.set(profile)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                # Raised before the headers go out, so the client sees a 500
+                _check_budget(scope, profile)
+                if SERVER_TIMING_ENABLED:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(profile, time.perf_counter() - started)))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
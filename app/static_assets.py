@@ -0,0 +1,260 @@
+"""Static asset serving with content-hashed URLs.
+
+At startup every file under ``static/`` is hashed into ``asset_manifest``.
+Templates link assets through the ``static_url`` helper, which appends the
+hash (``/static/css/style.css?v=1a2b3c4d5e6f``), so a changed file gets a new
+URL. ``StaticAssets`` serves a request carrying the current hash with a
+one-year immutable Cache-Control; any other request is revalidated. Either
+way the ETag is the content hash, so revalidation is answered with 304.
+
+Text assets are precompressed at startup into ``.br`` (when the ``brotli``
+package is installed) and ``.gz`` siblings, and the best one the client
+accepts is served with its Content-Encoding set, which GZipMiddleware passes
+through instead of compressing the same bytes on every request. Siblings
+older than their source are ignored.
+
+Uploads are named after their content (or a uuid, for older ones) and never
+rewritten, so they are served as immutable without being hashed here.
+
+    python -m app.static_assets    # precompress ahead of time, e.g. in the build step
+"""
+import gzip
+import hashlib
+import logging
+import os
+from mimetypes import guess_type
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = "static"
+STATIC_URL = "/static/"
+# Content-named user files: served as immutable, not hashed
+UPLOAD_DIRS = ("uploads", "derived")
+VERSION_LENGTH = 12
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".json", ".txt", ".map")
+# Content-Encoding -> sibling suffix, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+AVAILABLE_ENCODINGS = tuple(e for e, _ in ENCODINGS if e != "br" or brotli is not None)
+COMPRESSED_SUFFIXES = tuple(suffix for _, suffix in ENCODINGS)
+
+
+def _is_upload(path: str) -> bool:
+    return path.split("/", 1)[0] in UPLOAD_DIRS
+
+
+def _file_digest(full_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(full_path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AssetManifest:
+    """Content hash of every static asset, rehashed when a file's mtime or size changes"""
+
+    def __init__(self, directory: str = STATIC_DIR):
+        self.directory = directory
+        self._entries: Dict[str, Tuple[int, int, str]] = {}
+
+    def build(self) -> int:
+        """Hash every asset under the directory; returns how many there are"""
+        entries = {}
+        for root, dirs, files in os.walk(self.directory):
+            rel_root = os.path.relpath(root, self.directory).replace(os.sep, "/")
+            if rel_root == ".":
+                dirs[:] = [d for d in dirs if d not in UPLOAD_DIRS]
+                rel_root = ""
+            for name in files:
+                if name.endswith(COMPRESSED_SUFFIXES):
+                    continue
+                full_path = os.path.join(root, name)
+                stat_result = os.stat(full_path)
+                entries[f"{rel_root}/{name}".lstrip("/")] = (
+                    stat_result.st_mtime_ns, stat_result.st_size, _file_digest(full_path))
+        self._entries = entries
+        return len(entries)
+
+    def digest(self, path: str, stat_result: Optional[os.stat_result] = None) -> Optional[str]:
+        """SHA-256 of ``path`` (relative to the directory), or None if it is not an asset"""
+        path = path.lstrip("/")
+        if _is_upload(path) or path.endswith(COMPRESSED_SUFFIXES):
+            return None
+        full_path = os.path.join(self.directory, path)
+        try:
+            if stat_result is None:
+                stat_result = os.stat(full_path)
+            entry = self._entries.get(path)
+            if entry is None or entry[:2] != (stat_result.st_mtime_ns, stat_result.st_size):
+                entry = (stat_result.st_mtime_ns, stat_result.st_size, _file_digest(full_path))
+                self._entries[path] = entry
+        except OSError:
+            return None
+        return entry[2]
+
+    def version(self, path: str) -> Optional[str]:
+        digest = self.digest(path)
+        return digest[:VERSION_LENGTH] if digest else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+asset_manifest = AssetManifest()
+
+
+def static_url(path: str) -> str:
+    """URL of a static asset with its content version, e.g. ``static_url('css/style.css')``"""
+    path = path.lstrip("/")
+    version = asset_manifest.version(path)
+    return f"{STATIC_URL}{path}?v={version}" if version else f"{STATIC_URL}{path}"
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """``data`` compressed for a Content-Encoding of ``br`` or ``gzip``"""
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(directory: str = STATIC_DIR) -> int:
+    """Write missing or stale .br/.gz siblings of text assets; returns how many were written"""
+    encodings = [(e, s) for e, s in ENCODINGS if e in AVAILABLE_ENCODINGS]
+    written = 0
+    for root, dirs, files in os.walk(directory):
+        if os.path.abspath(root) == os.path.abspath(directory):
+            dirs[:] = [d for d in dirs if d not in UPLOAD_DIRS]
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            source = os.path.join(root, name)
+            data = None
+            for encoding, suffix in encodings:
+                target = source + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+                    continue
+                if data is None:
+                    with open(source, "rb") as f:
+                        data = f.read()
+                tmp = f"{target}.tmp-{os.getpid()}"
+                with open(tmp, "wb") as f:
+                    f.write(compress(data, encoding))
+                os.replace(tmp, target)
+                written += 1
+    return written
+
+
+def prepare(directory: str = STATIC_DIR) -> None:
+    """Startup hook: precompress text assets and build the manifest"""
+    try:
+        written = precompress(directory)
+    except OSError as e:
+        logger.warning("Could not precompress static assets: %s", e)
+        written = 0
+    count = asset_manifest.build()
+    logger.info("Static assets: %s hashed, %s compressed copies written", count, written)
+
+
+def accepted_encodings(request_headers: Headers) -> set:
+    """Content codings the client accepts (q=0 entries excluded)"""
+    accepted = set()
+    for item in request_headers.get("accept-encoding", "").split(","):
+        coding, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticAssets(StaticFiles):
+    """StaticFiles with content-hash ETags, immutable caching of versioned URLs and precompressed siblings"""
+
+    def __init__(self, *, directory: str = STATIC_DIR, manifest: AssetManifest = asset_manifest, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.manifest = manifest
+        self._root = os.path.realpath(directory)
+
+    def _precompressed(self, full_path: str, stat_result: os.stat_result, request_headers: Headers):
+        """(encoding, path, stat) of the sibling to send, or None for the file itself"""
+        accepted = accepted_encodings(request_headers)
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                sibling = os.stat(full_path + suffix)
+            except OSError:
+                continue
+            if sibling.st_mtime >= stat_result.st_mtime:
+                return encoding, full_path + suffix, sibling
+        return None
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        path = os.path.relpath(os.path.realpath(full_path), self._root).replace(os.sep, "/")
+        full_path = str(full_path)
+        headers = {}
+        send_path, send_stat = full_path, stat_result
+
+        if path.endswith(COMPRESSIBLE_EXTENSIONS):
+            headers["Vary"] = "Accept-Encoding"
+            sibling = self._precompressed(full_path, stat_result, request_headers)
+            if sibling is not None:
+                encoding, send_path, send_stat = sibling
+                headers["Content-Encoding"] = encoding
+
+        digest = self.manifest.digest(path, stat_result)
+        if digest is not None:
+            variant = f"-{headers['Content-Encoding']}" if "Content-Encoding" in headers else ""
+            headers["ETag"] = f'"{digest[:32]}{variant}"'
+            requested = QueryParams(scope.get("query_string", b"")).get("v")
+            versioned = requested == digest[:VERSION_LENGTH]
+            headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if versioned else REVALIDATE_CACHE_CONTROL
+        elif _is_upload(path):
+            headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+
+        response = FileResponse(send_path, status_code=status_code, headers=headers,
+                                media_type=guess_type(full_path)[0] or "text/plain", stat_result=send_stat)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class DynamicGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves paths under ``exclude_prefixes`` alone.
+
+    Static assets are either precompressed or already-compressed images, so
+    compressing them per request only burns CPU.
+    """
+
+    def __init__(self, app, exclude_prefixes: Tuple[str, ...] = (STATIC_URL,), **kwargs):
+        super().__init__(app, **kwargs)
+        self.exclude_prefixes = exclude_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(self.exclude_prefixes):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+if __name__ == "__main__":
+    print(f"{precompress()} compressed copies written")
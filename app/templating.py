@@ -0,0 +1,26 @@
+"""Shared Jinja2 templates for all routers, with the app's template helpers registered."""
+import time
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import Template
+
+from app.images import image_srcset
+from app.sql_profiler import add_render_time
+from app.static_assets import static_url
+
+
+class ProfiledTemplate(Template):
+    """Adds its render time to the current request's profile (Server-Timing)"""
+
+    def render(self, *args, **kwargs) -> str:
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            add_render_time(time.perf_counter() - started)
+
+
+templates = Jinja2Templates(directory="templates")
+templates.env.template_class = ProfiledTemplate
+templates.env.globals["image_srcset"] = image_srcset
+templates.env.globals["static_url"] = static_url
@@ -0,0 +1,285 @@
+"""Product image uploads.
+
+``save_uploads`` stores every image of a form submission concurrently. Each
+file is copied in ``UPLOAD_CHUNK_SIZE`` chunks on a worker thread, so the
+event loop never blocks on disk I/O and a file is never held in memory
+whole. While copying, the size is checked against ``MAX_UPLOAD_BYTES``,
+the first bytes are sniffed to confirm an allowed image type (the
+client-sent content type is not trusted), and the content is hashed.
+
+That per-file check only runs once Starlette has already spooled the whole
+multipart body, so ``UploadSizeLimitMiddleware`` caps the request itself
+first: a multipart request whose ``Content-Length`` (or streamed body) is
+over ``MAX_UPLOAD_REQUEST_BYTES`` gets a 413 before the form is parsed.
+
+Stored files are named after their SHA-256, so uploading the same image
+again reuses the existing file instead of writing a copy. Because of that
+a file may be shared by several products: delete with
+``delete_upload_if_unused``. A form's images are saved all or nothing.
+
+Reusing a file touches its mtime, and files written or reused within
+``UPLOAD_REUSE_GRACE_SECONDS`` are never deleted, so a request that was just
+handed an existing file keeps it until its product row is committed. An image
+removed within that window stays on disk.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import BinaryIO, List, Optional, Tuple
+
+from fastapi import UploadFile
+from starlette.responses import PlainTextResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.models import Product, ProductImage
+
+logger = logging.getLogger(__name__)
+
+UPLOADS_DIR = "static/uploads"
+UPLOADS_URL = "/static/uploads/"
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Files written or reused this recently are left alone by delete_upload_if_unused
+UPLOAD_REUSE_GRACE_SECONDS = int(os.getenv("UPLOAD_REUSE_GRACE_SECONDS", "600"))
+# Whole multipart request (all files plus form fields)
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(10 * MAX_UPLOAD_BYTES)))
+
+# Leading bytes of each accepted format -> stored extension
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
+os.makedirs(UPLOADS_DIR, exist_ok=True)
+
+
+class UploadRejected(Exception):
+    """Raised when an upload is too large or not an accepted image"""
+
+
+def _size_label(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / (1024 * 1024):.0f} MB"
+    return f"{size / 1024:.0f} KB"
+
+
+def max_upload_size_label() -> str:
+    """MAX_UPLOAD_BYTES for messages, e.g. "10 MB" """
+    return _size_label(MAX_UPLOAD_BYTES)
+
+
+class UploadSizeLimitMiddleware:
+    """Pure ASGI middleware answering 413 to multipart requests over MAX_UPLOAD_REQUEST_BYTES.
+
+    Checks ``Content-Length`` before the body is read. Bodies sent without one
+    are counted as they stream in; once over the limit the app sees a client
+    disconnect and its response is replaced by the 413.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        too_large = PlainTextResponse(f"Upload larger than {_size_label(self.max_bytes)}", status_code=413)
+        try:
+            declared = int(headers.get(b"content-length", b""))
+        except ValueError:
+            declared = None
+        if declared is not None and declared > self.max_bytes:
+            await too_large(scope, receive, send)
+            return
+
+        received = 0
+        overflowed = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, overflowed
+            if overflowed:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    overflowed = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if overflowed and not started:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not overflowed or started:
+                raise
+        if overflowed and not started:
+            await too_large(scope, receive, send)
+
+
+def _sniff_extension(head: bytes) -> Optional[str]:
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    # WebP: RIFF....WEBP
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def _store(source: BinaryIO, filename: str) -> Tuple[str, Optional[int]]:
+    """Copy ``source`` into UPLOADS_DIR under its content hash.
+
+    Returns the public URL and, when the file was newly written, its mtime in
+    nanoseconds (None when it duplicates a file already stored).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    extension = None
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOADS_DIR, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if extension is None:
+                    extension = _sniff_extension(chunk)
+                    if extension is None:
+                        raise UploadRejected(f"{filename}: not a JPEG, PNG, GIF or WebP image")
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise UploadRejected(f"{filename}: larger than {max_upload_size_label()}")
+                digest.update(chunk)
+                out.write(chunk)
+        if extension is None:
+            raise UploadRejected(f"{filename}: empty file")
+
+        name = f"{digest.hexdigest()[:32]}{extension}"
+        path = os.path.join(UPLOADS_DIR, name)
+        try:
+            # Mark the existing file as just reused so a concurrent delete keeps it
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        else:
+            logger.debug("Upload %s duplicates %s", filename, name)
+            os.remove(tmp_path)
+            return UPLOADS_URL + name, None
+        os.replace(tmp_path, path)
+        logger.debug("Stored upload %s (%s bytes) as %s", filename, size, name)
+        return UPLOADS_URL + name, os.stat(path).st_mtime_ns
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+async def _save(file: UploadFile) -> Tuple[str, Optional[int]]:
+    return await run_in_threadpool(_store, file.file, file.filename or "upload")
+
+
+def _remove_stored(stored: List[Tuple[str, int]]) -> None:
+    """Delete files written by a failed save_uploads call, unless another upload reused them since"""
+    for path, written_ns in stored:
+        try:
+            if os.stat(path).st_mtime_ns == written_ns:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Could not delete file %s from disk: %s", path, e)
+
+
+async def save_uploads(files: List[UploadFile]) -> List[str]:
+    """Store all non-empty uploads concurrently, in submission order.
+
+    All or nothing: if any file is rejected, the files this call newly wrote
+    are deleted again before ``UploadRejected`` is raised. Files that merely
+    duplicate an already stored image are left alone, since other products
+    may use them.
+    """
+    results = await asyncio.gather(*(_save(f) for f in files if f.filename), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if not errors:
+        return [url for url, _ in results]
+    created = [(_upload_file_path(r[0]), r[1]) for r in results
+               if not isinstance(r, BaseException) and r[1] is not None]
+    if created:
+        await run_in_threadpool(_remove_stored, created)
+        logger.debug("Removed %d upload(s) stored before a sibling was rejected", len(created))
+    raise errors[0]
+
+
+def _upload_file_path(url: str) -> Optional[str]:
+    if not url.startswith(UPLOADS_URL):
+        return None
+    name = os.path.basename(url[len(UPLOADS_URL):])
+    return os.path.join(UPLOADS_DIR, name) if name else None
+
+
+def _recently_used(path: str) -> bool:
+    return time.time() - os.stat(path).st_mtime < UPLOAD_REUSE_GRACE_SECONDS
+
+
+def _remove_if_stale(path: str) -> bool:
+    """Delete ``path`` unless it was written or reused within the grace window.
+
+    The file is first renamed aside and checked again, so an upload reusing it
+    in between either touched it before the rename (and it is put back) or
+    finds it gone and stores its own copy.
+    """
+    if _recently_used(path):
+        logger.debug("Keeping %s: written or reused in the last %ss", path, UPLOAD_REUSE_GRACE_SECONDS)
+        return False
+    doomed = f"{path}.deleting-{os.getpid()}-{threading.get_ident()}"
+    os.rename(path, doomed)
+    if _recently_used(doomed):
+        # Same content hash, so replacing a copy stored meanwhile is harmless
+        os.replace(doomed, path)
+        return False
+    os.remove(doomed)
+    return True
+
+
+async def delete_upload_if_unused(db: AsyncSession, url: str) -> bool:
+    """Remove an uploaded file from disk unless a product references it or it was just (re)used"""
+    path = _upload_file_path(url)
+    if path is None:
+        return False
+    in_use = await db.scalar(select(ProductImage.id).where(ProductImage.path == url).limit(1))
+    if in_use is None:
+        in_use = await db.scalar(select(Product.id).where(Product.image_url == url).limit(1))
+    if in_use is not None:
+        return False
+    try:
+        if not await run_in_threadpool(_remove_if_stale, path):
+            return False
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning("Could not delete file %s from disk: %s", path, e)
+        return False
+    logger.debug("File %s deleted from disk", path)
+    return True
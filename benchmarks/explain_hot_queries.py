@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Index coverage check for hot queries (PostgreSQL).
+
+EXPLAINs the session, catalog, favourites, upload and analytics queries the
+app runs most, built the same way as in app/routers and app/cleanup, and
+fails if any of them would sequentially scan its table. Sequential scans are
+disabled for the check (``SET enable_seqscan = off``), so a small or empty
+database still shows whether a usable index exists: the planner only falls
+back to a Seq Scan when no index can serve the query.
+
+    DATABASE_URL=postgresql://... python benchmarks/explain_hot_queries.py
+
+Run it against a database migrated to head (``alembic upgrade head``). Exits
+non-zero if a query regressed to a sequential scan.
+"""
+import os
+import sys
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import or_, select  # noqa: E402
+
+from app.database import engine  # noqa: E402
+from app.models import (Product, ProductImage, ProductSize, ProductStat, ProductStatDaily,  # noqa: E402
+                        Session, UserFavourite)
+
+NOW = datetime(2026, 1, 1)
+
+# (description, table that must not be seq-scanned, statement)
+HOT_QUERIES = [
+    ("session lookup (auth.get_current_session)", "sessions",
+     select(Session).where(Session.session_id == "x", Session.user_type == "user", Session.is_active.is_(True))),
+    ("session purge batch (cleanup.purge_sessions)", "sessions",
+     select(Session.id).where(or_(Session.expires_at < NOW, Session.is_active.is_(False))).limit(1000)),
+    ("catalog by category (products._catalog_products)", "products",
+     select(Product).where(Product.category == "Sports", Product.id > 0).order_by(Product.id).limit(25)),
+    ("dashboard by status (products.admin_dashboard)", "products",
+     select(Product).where(Product.status == "Available").order_by(Product.id).limit(51)),
+    ("catalog size filter (products._catalog_products)", "product_sizes",
+     select(ProductSize.product_id).where(ProductSize.size == "9")),
+    ("user favourites (auth._favourite_products)", "user_favourites",
+     select(Product).join(UserFavourite, UserFavourite.product_id == Product.id)
+     .where(UserFavourite.user_id == 1).order_by(UserFavourite.id)),
+    ("favourites of a product (products.delete_product)", "user_favourites",
+     select(UserFavourite.id).where(UserFavourite.product_id == 1)),
+    ("upload still referenced (uploads.delete_upload_if_unused)", "product_images",
+     select(ProductImage.id).where(ProductImage.path == "/static/uploads/x.jpg").limit(1)),
+    ("analytics top-N (products.admin_analytics)", "product_stats",
+     select(ProductStat.product_id).order_by(ProductStat.search_count.desc(), ProductStat.favourite_count.desc())
+     .limit(50)),
+    ("analytics trend (products.admin_analytics)", "product_stats_daily",
+     select(ProductStatDaily.day).where(ProductStatDaily.day >= NOW.date())),
+]
+
+
+def seq_scans(plan: dict) -> list:
+    """Relations sequentially scanned anywhere in an EXPLAIN (FORMAT JSON) plan node"""
+    found = [plan["Relation Name"]] if plan.get("Node Type") == "Seq Scan" else []
+    for child in plan.get("Plans", []):
+        found += seq_scans(child)
+    return found
+
+
+def main() -> int:
+    if engine is None or engine.dialect.name != "postgresql":
+        print("DATABASE_URL must point at a PostgreSQL database migrated to head")
+        return 2
+
+    failed = False
+    with engine.connect() as conn:
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        for description, table, stmt in HOT_QUERIES:
+            compiled = stmt.compile(dialect=engine.dialect)
+            plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+            scanned = [name for name in seq_scans(plan[0]["Plan"]) if name == table]
+            status = "FAIL (Seq Scan on %s)" % table if scanned else "OK"
+            failed = failed or bool(scanned)
+            print(f"{description:60} {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
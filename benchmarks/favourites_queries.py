@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Favourites page query count check.
+
+Signs in two users, one with a single favourite and one with many, and
+counts the SQL statements each issues for the profile and favourites pages.
+The counts must match: favourites, their products and the products' images
+are loaded with a fixed number of queries however many favourites there are.
+
+    python benchmarks/favourites_queries.py [--favourites 40]
+
+Requires httpx (pip install httpx). Uses a throwaway SQLite database.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="jbh-bench-"), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.database import Base, async_engine, engine, SessionLocal  # noqa: E402
+from app.models import Product, User, UserFavourite  # noqa: E402
+from app.routers.auth import get_password_hash  # noqa: E402
+from app.main import app  # noqa: E402
+
+PASSWORD = "bench-password"
+PAGES = ["/auth/user/profile", "/auth/user/favourites"]
+
+
+def seed(favourites: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        products = []
+        for i in range(favourites):
+            product = Product(name=f"Bench Shoe {i}", description="Benchmark product", price=999.0,
+                              category="Casual", status="Available")
+            product.set_images([f"/static/uploads/bench-{i}-a.jpg", f"/static/uploads/bench-{i}-b.jpg"])
+            product.set_sizes(["7", "8", "9"])
+            products.append(product)
+        db.add_all(products)
+        password = get_password_hash(PASSWORD)
+        few = User(name="Few", email="few@example.com", password=password)
+        many = User(name="Many", email="many@example.com", password=password)
+        db.add_all([few, many])
+        db.flush()
+        db.add(UserFavourite(user_id=few.id, product_id=products[0].id))
+        db.add_all([UserFavourite(user_id=many.id, product_id=p.id) for p in products])
+        db.commit()
+    finally:
+        db.close()
+
+
+class QueryCounter:
+    def __init__(self, sync_engine):
+        self.count = 0
+        event.listen(sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+async def page_queries(email: str, counter: QueryCounter):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/auth/user/login", data={"email": email, "password": PASSWORD})
+        assert response.status_code == 302, response.status_code
+        counts = {}
+        for page in PAGES:
+            await client.get(page)  # warm the session cache
+            before = counter.count
+            response = await client.get(page)
+            assert response.status_code == 200, (page, response.status_code)
+            counts[page] = counter.count - before
+        return counts
+
+
+async def main(favourites: int) -> int:
+    seed(favourites)
+    counter = QueryCounter(async_engine.sync_engine)
+    few = await page_queries("few@example.com", counter)
+    many = await page_queries("many@example.com", counter)
+
+    failed = False
+    for page in PAGES:
+        status = "OK" if few[page] == many[page] else "FAIL"
+        failed = failed or status == "FAIL"
+        print(f"{page:28} 1 favourite: {few[page]:3} queries   {favourites} favourites: {many[page]:3} queries   {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--favourites", type=int, default=40)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.favourites)))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Login storm load test.
+
+Drives the app in-process over ASGI and measures catalog latency on its own
+and while a burst of concurrent logins is running. With bcrypt on the
+password worker pool the two should be close; if hashing ran on the event
+loop every catalog request would wait behind the whole burst.
+
+    python benchmarks/login_storm.py [--logins 40] [--requests 50]
+
+Requires httpx (pip install httpx). Uses a throwaway SQLite database.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="jbh-bench-"), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import httpx  # noqa: E402
+
+from app.database import Base, engine, SessionLocal  # noqa: E402
+from app.models import Product, User  # noqa: E402
+from app.routers.auth import get_password_hash  # noqa: E402
+from app.main import app  # noqa: E402
+
+EMAIL = "storm@example.com"
+PASSWORD = "storm-password"
+
+
+def seed(products: int = 200) -> None:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.bulk_save_objects([
+            Product(name=f"Bench Shoe {i}", description="Benchmark product", price=999.0,
+                    category="Casual", status="Available")
+            for i in range(products)
+        ])
+        db.add(User(name="Storm", email=EMAIL, password=get_password_hash(PASSWORD)))
+        db.commit()
+    finally:
+        db.close()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def catalog_latencies(client, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = await client.get("/products/")
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    return samples
+
+
+async def login(client):
+    response = await client.post("/auth/user/login", data={"email": EMAIL, "password": PASSWORD})
+    return response.status_code
+
+
+async def main(logins: int, requests: int, max_slowdown: float) -> int:
+    seed()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await catalog_latencies(client, 5)  # warm up templates and the search index
+        baseline = await catalog_latencies(client, requests)
+
+        storm = [asyncio.create_task(login(client)) for _ in range(logins)]
+        await asyncio.sleep(0)
+        during = await catalog_latencies(client, requests)
+        statuses = await asyncio.gather(*storm)
+
+    base_p95, storm_p95 = percentile(baseline, 95), percentile(during, 95)
+    print(f"catalog p50/p95 alone:        {statistics.median(baseline):7.1f} / {base_p95:7.1f} ms")
+    print(f"catalog p50/p95 during storm: {statistics.median(during):7.1f} / {storm_p95:7.1f} ms")
+    print(f"logins: {logins} ({statuses.count(302)} ok, {statuses.count(503)} shed with 503)")
+
+    # Allow some noise; a blocked event loop shows up as seconds, not milliseconds
+    if storm_p95 > base_p95 * max_slowdown + 50:
+        print("FAIL: catalog latency degraded during the login storm")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--max-slowdown", type=float, default=3.0)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.logins, args.requests, args.max_slowdown)))
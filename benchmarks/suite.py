@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Route benchmark suite with a committed baseline.
+
+Seeds a database with a synthetic store (products with images and sizes,
+users, favourites, sessions) using bulk inserts, then drives the app
+in-process over ASGI and reports, per route, p50/p95/p99 latency, SQL
+statements per request and peak Python memory (tracemalloc) while serving it.
+
+    python benchmarks/suite.py [--scale tiny|small|medium|large] [--iterations 50]
+    python benchmarks/suite.py --scale small --update-baseline
+
+Scales (products / users / favourites / sessions):
+
+    tiny     100 /    50 /     500 /     200
+    small   1000 /   500 /    5000 /    2000
+    medium 10000 /  5000 /   50000 /   20000
+    large 100000 / 20000 /  200000 /  100000
+
+Routes run with ``QUERY_BUDGET_STRICT=true``, so exceeding a handler's
+``@query_budget`` aborts the run.
+
+``--products``, ``--users``, ``--favourites`` and ``--sessions`` override a
+scale's counts (the run is then not compared with the baseline).
+
+Results are compared with ``benchmarks/baseline.json`` for the same scale;
+the run fails if a route issues more queries than the baseline, if its p50
+or p95 grows by more than ``--latency-tolerance`` (default 1.0, i.e. twice
+the baseline, plus a small absolute allowance for timer noise), or if its
+peak memory grows by more than ``--memory-tolerance``. Query counts are
+exact; latencies depend on the machine, so regenerate the baseline with
+``--update-baseline`` where the check runs.
+
+Uses a throwaway SQLite database by default; set BENCH_DATABASE_URL to an
+empty PostgreSQL database to benchmark against Postgres instead. Requires
+httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if os.getenv("BENCH_DATABASE_URL"):
+    os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+else:
+    DB_PATH = os.path.join(tempfile.mkdtemp(prefix="jbh-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+# Keep background jobs and the contact spool out of the measurements
+os.environ.setdefault("SCHEDULER_ENABLED", "false")
+os.environ.setdefault("FEEDBACK_QUEUE_ENABLED", "false")
+# A route over its declared query budget fails the run
+os.environ.setdefault("QUERY_BUDGET_STRICT", "true")
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import httpx  # noqa: E402
+from sqlalchemy import event, func, insert, select  # noqa: E402
+
+from app.database import Base, async_engine, engine  # noqa: E402
+from app.models import Product, ProductImage, ProductSize, Session, User, UserFavourite  # noqa: E402
+from app.routers.auth import get_password_hash  # noqa: E402
+from app.main import app  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+SCALES = {
+    "tiny": {"products": 100, "users": 50, "favourites": 500, "sessions": 200},
+    "small": {"products": 1000, "users": 500, "favourites": 5000, "sessions": 2000},
+    "medium": {"products": 10000, "users": 5000, "favourites": 50000, "sessions": 20000},
+    "large": {"products": 100000, "users": 20000, "favourites": 200000, "sessions": 100000},
+}
+CATEGORIES = ["Sports", "Casual", "Formal", "Boots", "Sneakers", "Sandals"]
+SIZES = ["6", "7", "8", "9", "10", "11"]
+CHUNK = 5000
+SEED = 20261017
+
+EMAIL = "bench@example.com"
+PASSWORD = "bench-password"
+BENCH_FAVOURITES = 40  # favourites of the signed-in benchmark user
+
+# Absolute latency allowance on top of the relative tolerance (timer and scheduler noise)
+LATENCY_SLACK_MS = 2.0
+WARMUP = 3
+MEMORY_ITERATIONS = 10
+
+
+def _insert_chunked(conn, table, rows) -> None:
+    for start in range(0, len(rows), CHUNK):
+        conn.execute(insert(table), rows[start:start + CHUNK])
+
+
+def seed(counts: dict) -> dict:
+    """Bulk-insert a deterministic synthetic store; returns the ids the routes use"""
+    rng = random.Random(SEED)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        if conn.scalar(select(func.count()).select_from(Product)):
+            raise SystemExit("The benchmark database must be empty")
+
+        _insert_chunked(conn, Product.__table__, [
+            {"name": f"Bench {'Leather Boot' if i % 7 == 0 else 'Runner'} {i}",
+             "description": f"Synthetic product {i}\nGender: {'Male' if i % 2 else 'Female'}",
+             "price": 500 + (i % 400) * 10, "category": CATEGORIES[i % len(CATEGORIES)],
+             "status": "Out of Stock" if i % 5 == 0 else "Available",
+             "gender": "Male" if i % 2 else "Female", "image_url": f"/static/uploads/bench-{i}-0.jpg"}
+            for i in range(counts["products"])
+        ])
+        product_ids = list(conn.scalars(select(Product.id).order_by(Product.id)))
+        _insert_chunked(conn, ProductImage.__table__, [
+            {"product_id": pid, "path": f"/static/uploads/bench-{pid}-{n}.jpg", "position": n}
+            for pid in product_ids for n in range(2)
+        ])
+        _insert_chunked(conn, ProductSize.__table__, [
+            {"product_id": pid, "size": size}
+            for pid in product_ids for size in rng.sample(SIZES, 3)
+        ])
+
+        # bcrypt is slow on purpose: every synthetic user shares one hash
+        password = get_password_hash(PASSWORD)
+        _insert_chunked(conn, User.__table__, [{"name": "Bench", "email": EMAIL, "password": password}] + [
+            {"name": f"User {i}", "email": f"user{i}@example.com", "password": password}
+            for i in range(counts["users"] - 1)
+        ])
+        user_ids = list(conn.scalars(select(User.id).order_by(User.id)))
+        bench_user = user_ids[0]
+
+        # The benchmark user gets a fixed number of favourites; the rest are spread at random
+        bench_favourites = rng.sample(product_ids, min(BENCH_FAVOURITES, len(product_ids)))
+        pairs = {(bench_user, pid) for pid in bench_favourites}
+        target = max(counts["favourites"], len(pairs))
+        while len(pairs) < min(target, len(user_ids) * len(product_ids)):
+            pairs.add((rng.choice(user_ids[1:] or user_ids), rng.choice(product_ids)))
+        _insert_chunked(conn, UserFavourite.__table__, [
+            {"user_id": uid, "product_id": pid} for uid, pid in sorted(pairs)
+        ])
+
+        now = datetime.now()
+        _insert_chunked(conn, Session.__table__, [
+            {"session_id": f"bench-{i:08d}-{rng.getrandbits(64):016x}", "username": f"user{i}@example.com",
+             "user_type": "user", "user_id": rng.choice(user_ids),
+             "created_at": now - timedelta(days=1), "expires_at": now + timedelta(seconds=rng.randint(-86400, 86400)),
+             "is_active": i % 4 != 0}
+            for i in range(counts["sessions"])
+        ])
+
+    favourited = set(bench_favourites)
+    return {
+        "product_ids": product_ids,
+        "bench_favourites": bench_favourites,
+        "not_favourited": [pid for pid in product_ids if pid not in favourited],
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class QueryCounter:
+    def __init__(self, sync_engine):
+        self.count = 0
+        event.listen(sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def routes(ids: dict, iterations: int):
+    """(name, client, iterations, request factory) for every benchmarked route"""
+    rng = random.Random(SEED)
+    products = ids["product_ids"]
+    detail_ids = [rng.choice(products) for _ in range(iterations + WARMUP)]
+    middle = products[len(products) // 2]
+    # Each add is undone by the matching remove, so both routes see the same state every run
+    toggles = ids["not_favourited"][:iterations + WARMUP]
+
+    return [
+        ("catalog", "anonymous", iterations, lambda i: ("GET", "/products/")),
+        ("catalog_category", "anonymous", iterations, lambda i: ("GET", "/products/?category=Boots")),
+        ("catalog_search", "anonymous", iterations, lambda i: ("GET", "/products/?search=leather")),
+        ("catalog_api_next_page", "anonymous", iterations, lambda i: ("GET", f"/products/api/catalog?after={middle}")),
+        ("catalog_signed_in", "user", iterations, lambda i: ("GET", "/products/")),
+        ("product_detail", "anonymous", iterations, lambda i: ("GET", f"/products/{detail_ids[i]}")),
+        ("user_login", "anonymous", min(iterations, 10),
+         lambda i: ("POST", "/auth/user/login", {"email": EMAIL, "password": PASSWORD})),
+        ("favourites_page", "user", iterations, lambda i: ("GET", "/auth/user/favourites")),
+        ("favourites_status", "user", iterations, lambda i: ("GET", "/auth/user/favourites/status")),
+        ("favourites_add", "user", min(iterations, len(toggles) - WARMUP),
+         lambda i: ("POST", f"/auth/user/favourites/add/{toggles[i]}")),
+        ("favourites_remove", "user", min(iterations, len(toggles) - WARMUP),
+         lambda i: ("DELETE", f"/auth/user/favourites/remove/{toggles[i]}")),
+    ]
+
+
+async def _send(client, spec):
+    method, url, *data = spec
+    response = await client.request(method, url, data=data[0] if data else None)
+    assert response.status_code in (200, 302), (url, response.status_code)
+    return response
+
+
+async def measure(clients: dict, counter: QueryCounter, name, client_name, iterations, request) -> dict:
+    client = clients[client_name]
+    for i in range(WARMUP):
+        await _send(client, request(i))
+    # Start every route from the same collector state so one route's garbage is not billed to the next
+    gc.collect()
+    latencies, queries = [], []
+    for i in range(WARMUP, WARMUP + iterations):
+        spec = request(i)
+        before = counter.count
+        start = time.perf_counter()
+        await _send(client, spec)
+        latencies.append((time.perf_counter() - start) * 1000)
+        queries.append(counter.count - before)
+
+    # Separate pass: tracemalloc slows allocation-heavy code, so it stays out of the timings
+    tracemalloc.start()
+    baseline_bytes = tracemalloc.get_traced_memory()[0]
+    for i in range(WARMUP, WARMUP + min(iterations, MEMORY_ITERATIONS)):
+        await _send(client, request(i))
+    peak = tracemalloc.get_traced_memory()[1] - baseline_bytes
+    tracemalloc.stop()
+
+    return {
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        # Cache hits issue fewer; the most a request needed is the stable number to guard
+        "queries": max(queries),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def regressions(name: str, result: dict, base: dict, latency_tolerance: float, memory_tolerance: float) -> list:
+    problems = []
+    if result["queries"] > base["queries"]:
+        problems.append(f"{name}: {result['queries']} queries per request, baseline {base['queries']}")
+    for key in ("p50_ms", "p95_ms"):
+        limit = base[key] * (1 + latency_tolerance) + LATENCY_SLACK_MS
+        if result[key] > limit:
+            problems.append(f"{name}: {key} {result[key]} > {limit:.2f} (baseline {base[key]})")
+    limit = base["peak_kib"] * (1 + memory_tolerance)
+    if result["peak_kib"] > limit:
+        problems.append(f"{name}: peak {result['peak_kib']} KiB > {limit:.1f} KiB (baseline {base['peak_kib']})")
+    return problems
+
+
+async def run(counts: dict, iterations: int) -> dict:
+    started = time.perf_counter()
+    ids = seed(counts)
+    print(f"Seeded {counts} in {time.perf_counter() - started:.1f}s ({engine.dialect.name})")
+
+    counter = QueryCounter(async_engine.sync_engine)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as anonymous, \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as user:
+        response = await user.post("/auth/user/login", data={"email": EMAIL, "password": PASSWORD})
+        assert response.status_code == 302, response.status_code
+        clients = {"anonymous": anonymous, "user": user}
+        # Long-lived objects (modules, templates, the seed data) would otherwise be re-scanned
+        # by every full collection, showing up as random spikes in the percentiles
+        gc.collect()
+        gc.freeze()
+
+        results = {}
+        print(f"{'route':24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'peak KiB':>9}")
+        for name, client_name, route_iterations, request in routes(ids, iterations):
+            result = await measure(clients, counter, name, client_name, route_iterations, request)
+            results[name] = result
+            print(f"{name:24} {result['p50_ms']:8.2f} {result['p95_ms']:8.2f} {result['p99_ms']:8.2f} "
+                  f"{result['queries']:8} {result['peak_kib']:9.1f}")
+    return results
+
+
+def main(args) -> int:
+    counts = dict(SCALES[args.scale])
+    overrides = {key: getattr(args, key) for key in counts if getattr(args, key) is not None}
+    counts.update(overrides)
+    results = asyncio.run(run(counts, args.iterations))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        if overrides:
+            print("Not updating the baseline: counts differ from the scale")
+            return 2
+        baseline[args.scale] = {"counts": counts, "iterations": args.iterations, "routes": results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline for {args.scale} written to {os.path.relpath(args.baseline, ROOT)}")
+        return 0
+
+    entry = baseline.get(args.scale)
+    if overrides or entry is None or entry["counts"] != counts:
+        print("No baseline for these counts; not checking for regressions")
+        return 0
+
+    problems = []
+    for name, result in results.items():
+        if name in entry["routes"]:
+            problems += regressions(name, result, entry["routes"][name],
+                                    args.latency_tolerance, args.memory_tolerance)
+    for problem in problems:
+        print(f"FAIL {problem}")
+    if problems:
+        return 1
+    print(f"OK: no regressions against the {args.scale} baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="tiny")
+    parser.add_argument("--products", type=int)
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--favourites", type=int)
+    parser.add_argument("--sessions", type=int)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--latency-tolerance", type=float, default=1.0)
+    parser.add_argument("--memory-tolerance", type=float, default=0.25)
+    sys.exit(main(parser.parse_args()))